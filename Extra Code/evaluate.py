@@ -1,100 +1,16 @@
-import numpy as np
+import argparse
+import csv
+import hashlib
+import json
+import os
 import re
-import string
-from collections import Counter
-from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-from rouge_score import rouge_scorer
 import time
-import json
-
-def normalize_answer(s):
-    """Lower text and remove punctuation, articles, and extra whitespace."""
-    def remove_articles(text):
-        return re.sub(r'\b(a|an|the)\b', ' ', text)
-    def white_space_fix(text):
-        return ' '.join(text.split())
-    def remove_punctuation(text):
-        return ''.join(ch for ch in text if ch not in set(string.punctuation))
-    def lower(text):
-        return text.lower()
-
-    return white_space_fix(remove_articles(remove_punctuation(lower(s))))
-
-def f1_score(prediction, ground_truth):
-    prediction_tokens = normalize_answer(prediction).split()
-    ground_truth_tokens = normalize_answer(ground_truth).split()
-    common = Counter(prediction_tokens) & Counter(ground_truth_tokens)
-    num_same = sum(common.values())
-    if num_same == 0:
-        return 0
-    precision = 1.0 * num_same / len(prediction_tokens)
-    recall = 1.0 * num_same / len(ground_truth_tokens)
-    f1 = (2 * precision * recall) / (precision + recall)
-    return f1
-
-def exact_match_score(prediction, ground_truth):
-    return normalize_answer(prediction) == normalize_answer(ground_truth)
-
-def bleu_score(prediction, references):
-    reference_tokens = [normalize_answer(ref).split() for ref in references]
-    prediction_tokens = normalize_answer(prediction).split()
-    smoothing = SmoothingFunction().method4
-    return sentence_bleu(reference_tokens, prediction_tokens, smoothing_function=smoothing)
-
-def rouge_scores(prediction, reference):
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-    scores = scorer.score(normalize_answer(reference), normalize_answer(prediction))
-    return scores
-
-def calculate_metrics(predictions, references):
-    total_em = 0
-    total_f1 = 0
-    total_bleu = 0
-    total_rouge1 = 0
-    total_rouge2 = 0
-    total_rougeL = 0
-
-    for prediction, reference in zip(predictions, references):
-        total_em += exact_match_score(prediction, reference)
-        total_f1 += f1_score(prediction, reference)
-        total_bleu += bleu_score(prediction, [reference])
-        rouge = rouge_scores(prediction, reference)
-        total_rouge1 += rouge['rouge1'].fmeasure
-        total_rouge2 += rouge['rouge2'].fmeasure
-        total_rougeL += rouge['rougeL'].fmeasure
-
-    n = len(references)
-    metrics = {
-        "Exact Match": 100.0 * total_em / n,
-        "F1 Score": 100.0 * total_f1 / n,
-        "BLEU Score": 100.0 * total_bleu / n,
-        "ROUGE-1": 100.0 * total_rouge1 / n,
-        "ROUGE-2": 100.0 * total_rouge2 / n,
-        "ROUGE-L": 100.0 * total_rougeL / n,
-        "Number of observations": n
-    }
-
-    return metrics
-
-def metricsWrapper(input_file):
-    answers = []
-    llm_answers = []
-    with open(input_file, 'r') as file:
-        data = json.load(file)
-
-    counter = 0
-    # Iterate over each object in the JSON array and add the 'llm_answer'
-    for item in data:
-        # print(f'Current trial accessed: {item.get("trial_name", "")}')
-        if 'answer' in item.keys() and 'llm_answer' in item.keys():
-            answers.append(item.get('answer', ''))
-            llm_answers.append(item.get('llm_answer', ''))
+import numpy as np
+from metrics import METRICS_VERSION, METRIC_NAMES, BLEU_MAX_ORDER, score_pairs, aggregate_scores, corpus_bleu_scores, bootstrap_metrics
 
-    metrics = calculate_metrics(llm_answers, answers)
-    print(metrics)
+_SEPARATORS_PATTERN = re.compile(r'[\s,]*')
 
-_start = time.time()
-files = [
+FILES = [
     "How_has_this_trial_helped",
     "How_long_was_the_trial",
     "What_adverse_events_did_participants_report",
@@ -105,19 +21,147 @@ files = [
     "Why_was_the_research_needed"
 ]
 
-print('############################ <Script Logging>: Start calculating metrics')
-
-for file in files:
-    start = time.time()
-    print('############################################################################################################################################')
-    print(f'Current file accessed: {file}')
-    input_file = 'FinalDataset/Results/'+ file +'_with_llm_answers.json'
-    metricsWrapper(input_file)
-    end = time.time()
-    elapsedTime = end-start
-    print(f'############################ <Script Logging>: Elapsed Time for calculating metrics: {elapsedTime} seconds')
-    print('############################################################################################################################################')
-
-_end = time.time()
-_elapsedTime = _end-_start
-print(f'############################ <Script Logging>: Evaluate.py script has finished in: {_elapsedTime} seconds' )
\ No newline at end of file
+def iter_items(input_file, chunk_size=1 << 20):
+    """Yield the items of a JSON array file, or of a JSON Lines file, without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(input_file, 'r') as file:
+        buffer = file.read(chunk_size)
+        position = _SEPARATORS_PATTERN.match(buffer).end()
+        if not buffer.startswith('[', position):
+            # JSON Lines, as written by jobs that append answers
+            file.seek(0)
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        position += 1
+        while True:
+            position = _SEPARATORS_PATTERN.match(buffer, position).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The item runs past the buffer, read on
+                more = file.read(chunk_size)
+                if not more:
+                    if position == len(buffer):
+                        return
+                    raise
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield item
+
+def item_key(item):
+    # An item is rescored when its trial, question or either answer changes
+    answers = hashlib.sha256(f"{item['llm_answer']}\0{item['answer']}".encode('utf-8')).hexdigest()
+    return f"{item.get('trial_name', '')}\0{item.get('question', '')}\0{answers}"
+
+def load_score_cache(cache_path):
+    # key -> (scores row, BLEU counts row) of the previous run; a cache
+    # written by another version of the scoring code is thrown away
+    if not os.path.exists(cache_path):
+        return {}
+    with np.load(cache_path) as cache:
+        if 'version' not in cache.files or str(cache['version']) != METRICS_VERSION:
+            print(f"Ignoring {cache_path}, it was scored by another metrics version")
+            return {}
+        return {key: (scores, counts) for key, scores, counts in zip(cache['keys'].tolist(), cache['scores'], cache['counts'])}
+
+def save_score_cache(cache_path, keys, scores, counts):
+    # Written to a temporary file first, so an interrupted run keeps the old cache
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    with open(cache_path + '.part', 'wb') as file:
+        np.savez(file, version=np.array(METRICS_VERSION), keys=np.array(keys, dtype=str), scores=scores, counts=counts)
+    os.replace(cache_path + '.part', cache_path)
+
+def score_file(input_file, cache_path, workers=1):
+    """Per-item scores and BLEU counts of a result file, only scoring items missing from the cache.
+
+    Items without an answer or an llm_answer are skipped. The cache is
+    rewritten with the items of the file, so removed answers drop out of it.
+    """
+    cached = load_score_cache(cache_path)
+    keys = []
+    missing = {}
+    for item in iter_items(input_file):
+        if 'answer' in item and 'llm_answer' in item:
+            key = item_key(item)
+            keys.append(key)
+            if key not in cached:
+                missing[key] = (item['llm_answer'], item['answer'])
+
+    if missing:
+        llm_answers, answers = zip(*missing.values())
+        new_scores, new_counts = score_pairs(llm_answers, answers, workers, counts=True)
+        for key, scores, counts in zip(missing, new_scores, new_counts):
+            cached[key] = (scores, counts)
+    print(f"{input_file}: {len(missing)} new or changed answers scored, {len(keys) - len(missing)} taken from the cache")
+
+    scores = np.array([cached[key][0] for key in keys], dtype=np.float64).reshape(-1, len(METRIC_NAMES))
+    counts = np.array([cached[key][1] for key in keys], dtype=np.int64).reshape(-1, 2 * BLEU_MAX_ORDER + 2)
+    save_score_cache(cache_path, keys, scores, counts)
+    return scores, counts
+
+def summarize(scores, counts, n_resamples=0):
+    # One flat row of metrics, with bootstrap intervals when resamples are asked for
+    row = {"Number of observations": len(scores)}
+    if not len(scores):
+        return row
+    if n_resamples:
+        for name, interval in bootstrap_metrics(scores, counts, n_resamples).items():
+            row[name] = interval["score"]
+            row[f"{name} low"] = interval["low"]
+            row[f"{name} high"] = interval["high"]
+    else:
+        row.update(aggregate_scores(scores))
+        row["Corpus BLEU"] = 100.0 * float(corpus_bleu_scores(counts.sum(axis=0)))
+    return row
+
+def write_summary(summary, summary_file):
+    if summary_file.endswith('.csv'):
+        columns = list(dict.fromkeys(column for row in summary.values() for column in row))
+        with open(summary_file, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=["File"] + columns)
+            writer.writeheader()
+            for name, row in summary.items():
+                writer.writerow({"File": name, **row})
+    else:
+        with open(summary_file, 'w') as file:
+            json.dump(summary, file, indent=4)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Score the LLM answers of the question result files.")
+    argument_parser.add_argument("--results-dir", default="FinalDataset/Results")
+    argument_parser.add_argument("--files", nargs="+", default=FILES,
+                                 help="question files, read as <results-dir>/<file>_with_llm_answers.json")
+    argument_parser.add_argument("--cache-dir", default=None,
+                                 help="per-item score cache, defaults to <results-dir>/.score_cache")
+    argument_parser.add_argument("--summary", default="metrics_summary.json",
+                                 help="summary of all files, written as CSV when the name ends with .csv")
+    argument_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    argument_parser.add_argument("--bootstrap", type=int, default=0,
+                                 help="bootstrap resamples for confidence intervals, 0 to skip them")
+    args = argument_parser.parse_args()
+
+    cache_dir = args.cache_dir or os.path.join(args.results_dir, '.score_cache')
+    _start = time.time()
+    summary = {}
+    missing_files = []
+    for file in args.files:
+        input_file = os.path.join(args.results_dir, file + '_with_llm_answers.json')
+        if not os.path.isfile(input_file):
+            # Generation may still be running for this question
+            print(f"Skipping {input_file}, it does not exist yet")
+            missing_files.append(file)
+            continue
+        scores, counts = score_file(input_file, os.path.join(cache_dir, file + '.npz'), args.workers)
+        summary[file] = summarize(scores, counts, args.bootstrap)
+
+    write_summary(summary, args.summary)
+    print(f"Metrics of {len(summary)} files have been written to {args.summary} in {time.time() - _start:.2f} seconds")
+    if missing_files:
+        print(f"{len(missing_files)} files were missing: {', '.join(missing_files)}")
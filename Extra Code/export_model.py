@@ -0,0 +1,105 @@
+# export_model.py
+
+import argparse
+import os
+import time
+import json
+import torch
+from torch.quantization import quantize_dynamic
+from transformers import DistilBertForQuestionAnswering, DistilBertTokenizerFast
+from common_functions import prepare_data, calculate_metrics
+from predict_and_evaluate import (load_model, predict_test_set,
+                                  QUANTIZED_MODEL_FILE, ONNX_MODEL_FILE, ONNX_INT8_MODEL_FILE)
+
+def export_int8(model, pathToSaveModel):
+    # Dynamic int8 quantization of every Linear layer, weights stored as int8
+    quantized_model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    path = os.path.join(pathToSaveModel, QUANTIZED_MODEL_FILE)
+    torch.save(quantized_model, path)
+    print(f"Quantized model has been written to {path}")
+
+def export_onnx(model, tokenizer, pathToSaveModel, quantize=True):
+    path = os.path.join(pathToSaveModel, ONNX_MODEL_FILE)
+    dummy = tokenizer("What was the trial?", "The trial was long.", return_tensors="pt")
+
+    # Export logits as a plain tuple, with batch and sequence length left dynamic
+    model.config.return_dict = False
+    torch.onnx.export(
+        model,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["start_logits", "end_logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "start_logits": {0: "batch", 1: "sequence"},
+            "end_logits": {0: "batch", 1: "sequence"}
+        },
+        opset_version=18
+    )
+    model.config.return_dict = True
+    print(f"ONNX model has been written to {path}")
+
+    if quantize:
+        try:
+            from onnxruntime.quantization import quantize_dynamic as quantize_onnx, QuantType
+        except ImportError:
+            raise ImportError("onnxruntime is required to quantize the ONNX model")
+        int8_path = os.path.join(pathToSaveModel, ONNX_INT8_MODEL_FILE)
+        quantize_onnx(path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized ONNX model has been written to {int8_path}")
+
+def compare_backends(pathToSaveModel, tokenizer, testSet, backends, batch_size=16, max_length=384, stride=128,
+                     n_best=20, max_answer_length=None):
+    # Score every backend on the same test set and report the change against fp32
+    with open(testSet, 'r') as f:
+        test_dataset = prepare_data(json.load(f))
+
+    results = {}
+    for backend in ["torch"] + backends:
+        model = load_model(pathToSaveModel, backend)
+        start = time.time()
+        predictions, references = predict_test_set(model, tokenizer, test_dataset, batch_size, max_length, stride,
+                                                   n_best, max_answer_length)
+        elapsedTime = time.time() - start
+        results[backend] = calculate_metrics(predictions, references)
+        print(f"{backend}: {results[backend]} in {elapsedTime:.2f} seconds")
+
+    for backend in backends:
+        delta = {name: score - results["torch"][name] for name, score in results[backend].items()}
+        print(f"Accuracy delta of {backend} against fp32: {delta}")
+    return results
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Export a fine-tuned DistilBERT QA model for CPU serving.")
+    argument_parser.add_argument("pathToSaveModel")
+    argument_parser.add_argument("--int8", action="store_true", help="export a dynamically quantized torch model")
+    argument_parser.add_argument("--onnx", action="store_true", help="export an ONNX graph and its int8 quantized version")
+    argument_parser.add_argument("--test-set", default=None, help="report the accuracy delta of the exports on this test set")
+    argument_parser.add_argument("--batch-size", type=int, default=16)
+    argument_parser.add_argument("--max-length", type=int, default=384)
+    argument_parser.add_argument("--stride", type=int, default=128,
+                                 help="tokens of overlap between the windows of a long context")
+    argument_parser.add_argument("--n-best", type=int, default=20,
+                                 help="start and end candidates combined into answer spans")
+    argument_parser.add_argument("--max-answer-length", type=int, default=None,
+                                 help="longest answer in tokens, defaults to --max-length")
+    args = argument_parser.parse_args()
+
+    model = DistilBertForQuestionAnswering.from_pretrained(args.pathToSaveModel)
+    tokenizer = DistilBertTokenizerFast.from_pretrained(args.pathToSaveModel)
+    model.eval()
+
+    backends = []
+    if args.int8:
+        export_int8(model, args.pathToSaveModel)
+        backends.append("int8")
+    if args.onnx:
+        export_onnx(model, tokenizer, args.pathToSaveModel)
+        backends += ["onnx", "onnx-int8"]
+
+    if args.test_set:
+        compare_backends(args.pathToSaveModel, tokenizer, args.test_set, backends, args.batch_size,
+                         args.max_length, args.stride, args.n_best, args.max_answer_length)
@@ -0,0 +1,211 @@
+# metrics.py
+
+import re
+import string
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from nltk.stem import porter
+from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+from rouge_score import rouge_scorer, tokenize
+
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+_ARTICLES_PATTERN = re.compile(r'\b(a|an|the)\b')
+
+# Bump when a change here alters the scores, so cached per-item scores are recomputed
+METRICS_VERSION = "1"
+
+# Columns of the per-pair score arrays
+METRIC_NAMES = ["Exact Match", "F1 Score", "BLEU Score", "ROUGE-1", "ROUGE-2", "ROUGE-L"]
+# Columns of the BLEU count arrays: clipped n-gram matches and prediction
+# n-grams for orders 1-4, then the prediction and reference lengths
+BLEU_MAX_ORDER = 4
+
+class CachedStemTokenizer:
+    """The default ROUGE tokenizer with a Porter stemmer that remembers every stem.
+
+    Answers share most of their vocabulary, so each word is stemmed once per
+    process instead of once per occurrence.
+    """
+
+    def __init__(self):
+        self._stemmer = porter.PorterStemmer()
+        self._stems = {}
+
+    def stem(self, word):
+        stem = self._stems.get(word)
+        if stem is None:
+            stem = self._stemmer.stem(word)
+            self._stems[word] = stem
+        return stem
+
+    def tokenize(self, text):
+        return tokenize.tokenize(text, self)
+
+# Built once and shared by every call
+_SMOOTHING = SmoothingFunction().method4
+_ROUGE_SCORER = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], tokenizer=CachedStemTokenizer())
+
+def normalize_answer(s):
+    """Lower text and remove punctuation, articles, and extra whitespace."""
+    text = s.lower().translate(_PUNCTUATION_TABLE)
+    return ' '.join(_ARTICLES_PATTERN.sub(' ', text).split())
+
+def _f1(prediction_tokens, ground_truth_tokens):
+    common = Counter(prediction_tokens) & Counter(ground_truth_tokens)
+    num_same = sum(common.values())
+    if num_same == 0:
+        return 0
+    precision = 1.0 * num_same / len(prediction_tokens)
+    recall = 1.0 * num_same / len(ground_truth_tokens)
+    f1 = (2 * precision * recall) / (precision + recall)
+    return f1
+
+def f1_score(prediction, ground_truth):
+    return _f1(normalize_answer(prediction).split(), normalize_answer(ground_truth).split())
+
+def exact_match_score(prediction, ground_truth):
+    return normalize_answer(prediction) == normalize_answer(ground_truth)
+
+def bleu_score(prediction, references):
+    reference_tokens = [normalize_answer(ref).split() for ref in references]
+    prediction_tokens = normalize_answer(prediction).split()
+    return sentence_bleu(reference_tokens, prediction_tokens, smoothing_function=_SMOOTHING)
+
+def rouge_scores(prediction, reference):
+    return _ROUGE_SCORER.score(normalize_answer(reference), normalize_answer(prediction))
+
+def bleu_counts(prediction_tokens, reference_tokens):
+    """Sufficient statistics of corpus BLEU for one pair, as NLTK's corpus_bleu counts them."""
+    matches = []
+    totals = []
+    for order in range(1, BLEU_MAX_ORDER + 1):
+        prediction_ngrams = Counter(zip(*(prediction_tokens[i:] for i in range(order))))
+        reference_ngrams = Counter(zip(*(reference_tokens[i:] for i in range(order))))
+        matches.append(sum((prediction_ngrams & reference_ngrams).values()))
+        totals.append(max(1, sum(prediction_ngrams.values())))
+    return matches + totals + [len(prediction_tokens), len(reference_tokens)]
+
+def corpus_bleu_scores(counts):
+    """Corpus BLEU (no smoothing) of every row of summed bleu_counts, vectorised.
+
+    counts is a (..., 10) array of count sums; a corpus without any match
+    of some order scores 0.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    matches = counts[..., :BLEU_MAX_ORDER]
+    totals = counts[..., BLEU_MAX_ORDER:2 * BLEU_MAX_ORDER]
+    prediction_length = counts[..., -2]
+    reference_length = counts[..., -1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_precision = np.log(matches / totals).mean(axis=-1)
+        brevity_penalty = np.where(prediction_length > reference_length, 1.0,
+                                   np.exp(1 - reference_length / prediction_length))
+        bleu = brevity_penalty * np.exp(log_precision)
+    return np.where((matches > 0).all(axis=-1) & (prediction_length > 0), bleu, 0.0)
+
+def _score_normalized(normalized_prediction, normalized_reference):
+    prediction_tokens = normalized_prediction.split()
+    reference_tokens = normalized_reference.split()
+
+    rouge = _ROUGE_SCORER.score(normalized_reference, normalized_prediction)
+    return (
+        normalized_prediction == normalized_reference,
+        _f1(prediction_tokens, reference_tokens),
+        sentence_bleu([reference_tokens], prediction_tokens, smoothing_function=_SMOOTHING),
+        rouge['rouge1'].fmeasure,
+        rouge['rouge2'].fmeasure,
+        rouge['rougeL'].fmeasure
+    )
+
+def score_pair(prediction, reference):
+    """(EM, F1, BLEU, ROUGE-1, ROUGE-2, ROUGE-L) of one pair, normalising each string once."""
+    return _score_normalized(normalize_answer(prediction), normalize_answer(reference))
+
+def _score_chunk(pairs, counts=False):
+    scores = []
+    count_rows = []
+    for prediction, reference in pairs:
+        normalized_prediction = normalize_answer(prediction)
+        normalized_reference = normalize_answer(reference)
+        scores.append(_score_normalized(normalized_prediction, normalized_reference))
+        if counts:
+            count_rows.append(bleu_counts(normalized_prediction.split(), normalized_reference.split()))
+
+    scores = np.array(scores, dtype=np.float64).reshape(-1, len(METRIC_NAMES))
+    if counts:
+        return scores, np.array(count_rows, dtype=np.int64).reshape(-1, 2 * BLEU_MAX_ORDER + 2)
+    return scores
+
+def score_pairs(predictions, references, workers=1, counts=False):
+    """Per-pair scores as an (n, 6) float64 array with the METRIC_NAMES columns.
+
+    With several workers the pairs are scored in chunks across a process
+    pool; the rows stay in input order. With counts=True the (n, 10)
+    bleu_counts array of the pairs is returned as well.
+    """
+    pairs = list(zip(predictions, references))
+    if workers <= 1 or len(pairs) < 2:
+        return _score_chunk(pairs, counts)
+
+    chunk_size = -(-len(pairs) // (workers * 4))
+    chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_score_chunk, chunks, [counts] * len(chunks)))
+    if counts:
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+    return np.concatenate(results)
+
+def aggregate_scores(scores):
+    # A running sum adds the rows in order like the former scoring loop, so
+    # the means match it to the last bit (np.sum would sum pairwise)
+    n = len(scores)
+    totals = scores.cumsum(axis=0)[-1]
+    return {name: 100.0 * float(total) / n for name, total in zip(METRIC_NAMES, totals)}
+
+def calculate_metrics(predictions, references, workers=1):
+    return aggregate_scores(score_pairs(predictions, references, workers))
+
+def bootstrap_metrics(scores, counts, n_resamples=1000, confidence=0.95, seed=42, block_size=256):
+    """Metric means, corpus BLEU and their bootstrap confidence intervals.
+
+    Resampled indices are turned into per-pair draw counts with a single
+    bincount, so the sums of a block of resamples are one matrix product
+    with the per-pair score and BLEU count arrays.
+    Returns {metric: {"score", "low", "high"}}.
+    """
+    n = len(scores)
+    rng = np.random.default_rng(seed)
+    resampled = []
+    for start in range(0, n_resamples, block_size):
+        size = min(block_size, n_resamples - start)
+        indices = rng.integers(0, n, size=(size, n)) + n * np.arange(size)[:, None]
+        draws = np.bincount(indices.ravel(), minlength=size * n).reshape(size, n).astype(np.float64)
+        means = 100.0 * (draws @ scores) / n
+        corpus_bleu = 100.0 * corpus_bleu_scores(draws @ counts)
+        resampled.append(np.column_stack([means, corpus_bleu]))
+    resampled = np.concatenate(resampled)
+
+    point = aggregate_scores(scores)
+    point["Corpus BLEU"] = 100.0 * float(corpus_bleu_scores(counts.sum(axis=0)))
+    alpha = (1 - confidence) / 2
+    lows, highs = np.quantile(resampled, [alpha, 1 - alpha], axis=0)
+    return {
+        name: {"score": point[name], "low": float(low), "high": float(high)}
+        for name, low, high in zip(METRIC_NAMES + ["Corpus BLEU"], lows, highs)
+    }
+
+def metrics_report(predictions, references, questions=None, workers=1, n_resamples=1000, confidence=0.95, seed=42):
+    """Bootstrap metrics of all pairs and, when questions are given, of every question separately."""
+    scores, counts = score_pairs(predictions, references, workers, counts=True)
+    report = {"Overall": bootstrap_metrics(scores, counts, n_resamples, confidence, seed)}
+    report["Overall"]["Number of observations"] = len(scores)
+
+    if questions is not None:
+        questions = np.asarray(questions)
+        for question in dict.fromkeys(questions.tolist()):
+            rows = questions == question
+            report[question] = bootstrap_metrics(scores[rows], counts[rows], n_resamples, confidence, seed)
+            report[question]["Number of observations"] = int(rows.sum())
+    return report
@@ -1,91 +1,233 @@
 # predict_and_evaluate.py
 
-import sys
+import argparse
 import os
 import torch
 import json
+from types import SimpleNamespace
 from transformers import DistilBertForQuestionAnswering, DistilBertTokenizerFast
 from common_functions import prepare_data, calculate_metrics
-
-pathToSaveModel = sys.argv[1]
-testSet = sys.argv[2]
-
-# Extract the base name of the test set to use for the metrics file
-testSetName = os.path.basename(testSet).replace('.json', '')  # Remove the file extension
-metrics_file = f"metrics_{testSetName}.txt"
-
-# Load the pre-trained DistilBERT model and tokenizer
-model = DistilBertForQuestionAnswering.from_pretrained(pathToSaveModel)
-tokenizer = DistilBertTokenizerFast.from_pretrained(pathToSaveModel)
-
-# Load the test dataset
-with open(testSet, 'r') as f:
-    test_data = json.load(f)
-
-# Prepare the test dataset in the correct format
-test_dataset = prepare_data(test_data)
+from metrics import metrics_report
+
+# Files written next to the fine-tuned model by export_model.py
+QUANTIZED_MODEL_FILE = "model_int8.pt"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+BACKENDS = ["torch", "int8", "onnx", "onnx-int8"]
+
+class OnnxQuestionAnswering:
+    """Runs an exported ONNX graph with the same call signature as the torch model."""
+
+    def __init__(self, onnx_path):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("onnxruntime is required to serve the ONNX model")
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask):
+        start_logits, end_logits = self.session.run(
+            ["start_logits", "end_logits"],
+            {"input_ids": input_ids.numpy(), "attention_mask": attention_mask.numpy()}
+        )
+        return SimpleNamespace(start_logits=torch.from_numpy(start_logits), end_logits=torch.from_numpy(end_logits))
+
+def load_model(pathToSaveModel, backend="torch"):
+    # Load the fine-tuned model for one of the BACKENDS
+    if backend == "torch":
+        model = DistilBertForQuestionAnswering.from_pretrained(pathToSaveModel)
+    elif backend == "int8":
+        model = torch.load(os.path.join(pathToSaveModel, QUANTIZED_MODEL_FILE), weights_only=False)
+    elif backend == "onnx":
+        return OnnxQuestionAnswering(os.path.join(pathToSaveModel, ONNX_MODEL_FILE))
+    elif backend == "onnx-int8":
+        return OnnxQuestionAnswering(os.path.join(pathToSaveModel, ONNX_INT8_MODEL_FILE))
+    else:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    model.eval()
+    return model
+
+def best_spans(start_logits, end_logits, context_mask, n_best=20, max_answer_length=None):
+    """Best (score, start, end) answer span of every window of a batch.
+
+    The n_best start and end candidates of each window are combined in one
+    (windows, n_best, n_best) score tensor; spans outside the context,
+    ending before they start or longer than max_answer_length are masked
+    out. Windows without any valid span get a score of -inf. Without
+    max_answer_length a span may cover the whole window.
+    """
+    if max_answer_length is None:
+        max_answer_length = start_logits.shape[1]
+    start_logits = start_logits.masked_fill(~context_mask, float('-inf'))
+    end_logits = end_logits.masked_fill(~context_mask, float('-inf'))
+
+    k = min(n_best, start_logits.shape[1])
+    start_scores, start_indices = torch.topk(start_logits, k, dim=1)
+    end_scores, end_indices = torch.topk(end_logits, k, dim=1)
+
+    scores = start_scores[:, :, None] + end_scores[:, None, :]
+    lengths = end_indices[:, None, :] - start_indices[:, :, None]
+    scores = scores.masked_fill((lengths < 0) | (lengths >= max_answer_length), float('-inf'))
+
+    best_scores, best = scores.flatten(1).max(dim=1)
+    best_starts = start_indices.gather(1, (best // k)[:, None]).squeeze(1)
+    best_ends = end_indices.gather(1, (best % k)[:, None]).squeeze(1)
+    return best_scores, best_starts, best_ends
 
 # Function to get predictions
-def get_predictions(question, context):
-    inputs = tokenizer(
-        question,
-        context,
-        truncation=True,
-        padding='max_length',
-        max_length=384,
-        return_tensors="pt"
+def get_predictions(model, tokenizer, questions, contexts, batch_size=16, max_length=384, stride=128,
+                    n_best=20, max_answer_length=None):
+    """Answer every (question, context) pair, batch_size windows per forward pass.
+
+    Contexts longer than max_length are split into overlapping windows
+    (stride tokens of overlap) and the best span over all windows of a
+    pair is its answer. Windows are tokenized once, sorted by length and
+    padded only up to the longest window of their batch. Answers are
+    returned in input order. max_answer_length defaults to max_length, so
+    an answer may span a whole window.
+    """
+    if max_answer_length is None:
+        max_answer_length = max_length
+    encodings = tokenizer(
+        questions,
+        contexts,
+        truncation='only_second',
+        max_length=max_length,
+        stride=stride,
+        return_overflowing_tokens=True,
+        return_offsets_mapping=True
     )
-    
-    with torch.no_grad():
-        outputs = model(**inputs)
-
-    start_logits = outputs.start_logits
-    end_logits = outputs.end_logits
-    
-    start_index = torch.argmax(start_logits, dim=1).item()
-    end_index = torch.argmax(end_logits, dim=1).item()
-    
-    if end_index < start_index:
-        return ""
-
-    tokens = inputs['input_ids'][0][start_index:end_index + 1]
-    answer = tokenizer.decode(tokens, skip_special_tokens=True)
-    
-    return answer if answer.strip() else ""
-
-# Generate predictions on the test dataset
-predictions = []
-references = []
-
-for i in range(len(test_dataset)):
-    example = test_dataset[i]
-    print(example['trial_name'])
-    question = example['question']
-    context = example['context']
-    actual_answer = example['answer']['text'][0]
-
-    if not actual_answer:
-        print(f"Skipping example {i} due to missing answer.")
-        continue
-
-    pred = get_predictions(question, context)
-
-    if pred == "":
-        print(f"Prediction is None for example {i}.")
-
-    predictions.append(pred)
-    if example['trial_name']=='CLHC165X2101':
-        print(pred)
-    references.append(actual_answer)
-
-# Calculate and print the metrics
-metrics = calculate_metrics(predictions, references)
-print(metrics)
-
-# Write metrics to a file
-with open(metrics_file, 'w') as f:
-    f.write("Evaluation Metrics:\n")
-    for metric_name, score in metrics.items():
-        f.write(f"{metric_name}: {score:.2f}\n")
-
-print(f"Metrics have been written to {metrics_file}")
+    sample_mapping = encodings['overflow_to_sample_mapping']
+    lengths = [len(input_ids) for input_ids in encodings['input_ids']]
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+    best = [(float('-inf'), None, None)] * len(questions)
+    for batch_start in range(0, len(order), batch_size):
+        batch_indices = order[batch_start:batch_start + batch_size]
+        batch = tokenizer.pad(
+            {
+                'input_ids': [encodings['input_ids'][i] for i in batch_indices],
+                'attention_mask': [encodings['attention_mask'][i] for i in batch_indices]
+            },
+            padding='longest',
+            return_tensors="pt"
+        )
+
+        with torch.no_grad():
+            outputs = model(**batch)
+
+        # Only context tokens (sequence id 1) can be part of the answer
+        context_mask = torch.zeros_like(batch['attention_mask'], dtype=torch.bool)
+        for row, i in enumerate(batch_indices):
+            sequence_ids = encodings.sequence_ids(i)
+            context_mask[row, :len(sequence_ids)] = torch.tensor([sequence_id == 1 for sequence_id in sequence_ids])
+
+        scores, starts, ends = best_spans(outputs.start_logits, outputs.end_logits, context_mask, n_best, max_answer_length)
+
+        # Keep the best window of every pair
+        for row, i in enumerate(batch_indices):
+            sample = sample_mapping[i]
+            score = scores[row].item()
+            if score > best[sample][0]:
+                offsets = encodings['offset_mapping'][i]
+                best[sample] = (score, offsets[starts[row].item()][0], offsets[ends[row].item()][1])
+
+    answers = []
+    for (score, start_char, end_char), context in zip(best, contexts):
+        answer = context[start_char:end_char] if start_char is not None else ""
+        answers.append(answer if answer.strip() else "")
+    return answers
+
+def predict_test_set(model, tokenizer, test_dataset, batch_size=16, max_length=384, stride=128,
+                     n_best=20, max_answer_length=None):
+    # Returns the predictions and references of every example with an answer
+    example_indices = []
+    questions = []
+    contexts = []
+    references = []
+
+    for i in range(len(test_dataset)):
+        example = test_dataset[i]
+        print(example['trial_name'])
+        actual_answer = example['answer']['text'][0]
+
+        if not actual_answer:
+            print(f"Skipping example {i} due to missing answer.")
+            continue
+
+        example_indices.append(i)
+        questions.append(example['question'])
+        contexts.append(example['context'])
+        references.append(actual_answer)
+
+    predictions = get_predictions(model, tokenizer, questions, contexts, batch_size, max_length, stride,
+                                  n_best, max_answer_length)
+    for i, pred in zip(example_indices, predictions):
+        if pred == "":
+            print(f"Prediction is None for example {i}.")
+
+    return predictions, references
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Evaluate a fine-tuned DistilBERT QA model on a test set.")
+    argument_parser.add_argument("pathToSaveModel")
+    argument_parser.add_argument("testSet")
+    argument_parser.add_argument("--batch-size", type=int, default=16)
+    argument_parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                                 help="serve the fp32 model or one exported by export_model.py")
+    argument_parser.add_argument("--max-length", type=int, default=384)
+    argument_parser.add_argument("--stride", type=int, default=128,
+                                 help="tokens of overlap between the windows of a long context")
+    argument_parser.add_argument("--n-best", type=int, default=20,
+                                 help="start and end candidates combined into answer spans")
+    argument_parser.add_argument("--max-answer-length", type=int, default=None,
+                                 help="longest answer in tokens, defaults to --max-length")
+    argument_parser.add_argument("--workers", type=int, default=1,
+                                 help="processes used to score the predictions")
+    argument_parser.add_argument("--bootstrap", type=int, default=0,
+                                 help="bootstrap resamples for corpus BLEU, confidence intervals and per-question metrics")
+    args = argument_parser.parse_args()
+
+    pathToSaveModel = args.pathToSaveModel
+    testSet = args.testSet
+
+    # Extract the base name of the test set to use for the metrics file
+    testSetName = os.path.basename(testSet).replace('.json', '')  # Remove the file extension
+    metrics_file = f"metrics_{testSetName}.txt"
+
+    # Load the pre-trained DistilBERT model and tokenizer
+    model = load_model(pathToSaveModel, args.backend)
+    tokenizer = DistilBertTokenizerFast.from_pretrained(pathToSaveModel)
+
+    # Load the test dataset
+    with open(testSet, 'r') as f:
+        test_data = json.load(f)
+
+    # Prepare the test dataset in the correct format
+    test_dataset = prepare_data(test_data)
+
+    # Generate predictions on the test dataset
+    predictions, references = predict_test_set(model, tokenizer, test_dataset, args.batch_size, args.max_length, args.stride,
+                                                args.n_best, args.max_answer_length)
+
+    # Calculate and print the metrics
+    metrics = calculate_metrics(predictions, references, args.workers)
+    print(metrics)
+
+    # Write metrics to a file
+    with open(metrics_file, 'w') as f:
+        f.write("Evaluation Metrics:\n")
+        for metric_name, score in metrics.items():
+            f.write(f"{metric_name}: {score:.2f}\n")
+
+    print(f"Metrics have been written to {metrics_file}")
+
+    if args.bootstrap:
+        # Same filter as predict_test_set: examples without an answer are skipped
+        questions = [example['question'] for example in test_dataset if example['answer']['text'][0]]
+        report = metrics_report(predictions, references, questions, args.workers, args.bootstrap)
+        report_file = f"metrics_{testSetName}_bootstrap.json"
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Bootstrap metrics have been written to {report_file}")
@@ -1,50 +1,74 @@
 # train_model.py
 
-import sys
-from transformers import DistilBertForQuestionAnswering, DistilBertTokenizerFast, Trainer, TrainingArguments
+import argparse
+import hashlib
+import os
+import torch
+from bisect import bisect_left, bisect_right
+from datasets import load_from_disk
+from transformers import DistilBertForQuestionAnswering, DistilBertTokenizerFast, DataCollatorWithPadding, Trainer, TrainingArguments
 from sklearn.model_selection import train_test_split
 import json
 
 from common_functions import prepare_data
 
-pathToSaveModel = sys.argv[1]
-trainSet = sys.argv[2]
+MODEL_NAME = 'distilbert-base-uncased'
+# Bump when the preprocessing changes, so cached datasets are rebuilt
+PREPROCESS_VERSION = "2"
+
+argument_parser = argparse.ArgumentParser(description="Fine-tune DistilBERT for question answering on a training set.")
+argument_parser.add_argument("pathToSaveModel")
+argument_parser.add_argument("trainSet")
+argument_parser.add_argument("--max-length", type=int, default=384)
+argument_parser.add_argument("--stride", type=int, default=128,
+                             help="tokens of overlap between the windows of a long context")
+argument_parser.add_argument("--cache-dir", default="tokenized_cache",
+                             help="directory of the cached tokenized train/eval splits")
+argument_parser.add_argument("--gradient-accumulation-steps", type=int, default=1)
+argument_parser.add_argument("--threads", type=int, default=None,
+                             help="number of CPU threads used by torch, defaults to all cores")
+args = argument_parser.parse_args()
+
+pathToSaveModel = args.pathToSaveModel
+trainSet = args.trainSet
+
+if args.threads:
+    torch.set_num_threads(args.threads)
 
 # Load the pre-trained DistilBERT model and tokenizer
-model = DistilBertForQuestionAnswering.from_pretrained('distilbert-base-uncased')
-tokenizer = DistilBertTokenizerFast.from_pretrained('distilbert-base-uncased')
-
-# Load the training dataset
-with open(trainSet, 'r') as f:
-    train_data = json.load(f)
-
-# Prepare the dataset in the correct format
-full_train_dataset = prepare_data(train_data)
-
-# Split the training data into training and validation sets
-train_size = 0.8  # 80% for training, 20% for validation
-train_indices, val_indices = train_test_split(list(range(len(full_train_dataset))), train_size=train_size, random_state=42)
-
-train_dataset = full_train_dataset.select(train_indices)
-eval_dataset = full_train_dataset.select(val_indices)
-
-# Preprocessing function
+model = DistilBertForQuestionAnswering.from_pretrained(MODEL_NAME)
+tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_NAME)
+
+# Cached splits are keyed by everything the tokenized windows depend on
+with open(trainSet, 'rb') as f:
+    data_hash = hashlib.sha256(f.read()).hexdigest()
+cache_key = hashlib.sha256(
+    f"{PREPROCESS_VERSION}:{MODEL_NAME}:{args.max_length}:{args.stride}:{data_hash}".encode()
+).hexdigest()[:16]
+cache_path = os.path.join(args.cache_dir, cache_key)
+
+# Preprocessing function: long contexts are split into overlapping windows,
+# each labelled with the answer span or with the [CLS] token when the answer
+# is not fully inside the window
 def preprocess_function(examples):
     inputs = tokenizer(
-        examples['question'], 
-        examples['context'], 
-        truncation=True, 
-        padding='max_length', 
-        max_length=384,
+        examples['question'],
+        examples['context'],
+        truncation='only_second',
+        padding=False,  # Batches are padded by the collator
+        max_length=args.max_length,
+        stride=args.stride,
+        return_overflowing_tokens=True,
         return_offsets_mapping=True
     )
-    
+
+    sample_mapping = inputs.pop("overflow_to_sample_mapping")
     offset_mapping = inputs.pop("offset_mapping")
     start_positions = []
     end_positions = []
 
     for i, offset in enumerate(offset_mapping):
-        answer = examples["answer"][i]
+        answer = examples["answer"][sample_mapping[i]]
         start_char = answer["answer_start"][0]
         end_char = start_char + len(answer["text"][0])
 
@@ -53,26 +77,55 @@ def preprocess_function(examples):
         context_start = sequence_ids.index(1)
         context_end = len(sequence_ids) - 1 - sequence_ids[::-1].index(1)
 
-        if offset[context_start][0] > end_char or offset[context_end][1] < start_char:
+        if start_char < 0 or offset[context_start][0] > start_char or offset[context_end][1] < end_char:
             start_positions.append(0)
             end_positions.append(0)
         else:
-            start_idx = context_start
-            end_idx = context_end
-            while start_idx <= context_end and offset[start_idx][0] <= start_char:
-                start_idx += 1
-            while end_idx >= context_start and offset[end_idx][1] >= end_char:
-                end_idx -= 1
-            start_positions.append(start_idx - 1)
-            end_positions.append(end_idx + 1)
+            # Context offsets are sorted: the start token is the last one
+            # starting at or before start_char, the end token the first one
+            # ending at or after end_char
+            context_offsets = offset[context_start:context_end + 1]
+            starts = [token_start for token_start, token_end in context_offsets]
+            ends = [token_end for token_start, token_end in context_offsets]
+            start_positions.append(context_start + bisect_right(starts, start_char) - 1)
+            end_positions.append(context_start + bisect_left(ends, end_char))
 
     inputs["start_positions"] = start_positions
     inputs["end_positions"] = end_positions
     return inputs
 
-# Apply the preprocessing function to the datasets
-tokenized_train_dataset = train_dataset.map(preprocess_function, batched=True, remove_columns=train_dataset.column_names)
-tokenized_eval_dataset = eval_dataset.map(preprocess_function, batched=True, remove_columns=eval_dataset.column_names)
+if os.path.isdir(cache_path):
+    # Memory-mapped Arrow files, no preprocessing needed
+    tokenized_train_dataset = load_from_disk(os.path.join(cache_path, "train"))
+    tokenized_eval_dataset = load_from_disk(os.path.join(cache_path, "eval"))
+    print(f"Loaded the tokenized datasets from {cache_path}")
+else:
+    # Load the training dataset
+    with open(trainSet, 'r') as f:
+        train_data = json.load(f)
+
+    # Prepare the dataset in the correct format
+    full_train_dataset = prepare_data(train_data)
+
+    # Split the training data into training and validation sets
+    train_size = 0.8  # 80% for training, 20% for validation
+    train_indices, val_indices = train_test_split(list(range(len(full_train_dataset))), train_size=train_size, random_state=42)
+
+    train_dataset = full_train_dataset.select(train_indices)
+    eval_dataset = full_train_dataset.select(val_indices)
+
+    # Apply the preprocessing function to the datasets
+    tokenized_train_dataset = train_dataset.map(preprocess_function, batched=True, remove_columns=train_dataset.column_names)
+    tokenized_eval_dataset = eval_dataset.map(preprocess_function, batched=True, remove_columns=eval_dataset.column_names)
+
+    # Save to a temporary directory first, so an interrupted run leaves no partial cache
+    partial_path = cache_path + ".part"
+    tokenized_train_dataset.save_to_disk(os.path.join(partial_path, "train"))
+    tokenized_eval_dataset.save_to_disk(os.path.join(partial_path, "eval"))
+    os.replace(partial_path, cache_path)
+    tokenized_train_dataset = load_from_disk(os.path.join(cache_path, "train"))
+    tokenized_eval_dataset = load_from_disk(os.path.join(cache_path, "eval"))
+    print(f"Tokenized datasets have been cached to {cache_path}")
 
 # Set training arguments
 training_args = TrainingArguments(
@@ -84,6 +137,8 @@ training_args = TrainingArguments(
     num_train_epochs=3,
     weight_decay=0.01,
     save_strategy="epoch",
+    gradient_accumulation_steps=args.gradient_accumulation_steps,
+    group_by_length=True,  # Batch windows of similar length, so little compute goes to padding
 )
 
 # Initialize Trainer
@@ -93,6 +148,7 @@ trainer = Trainer(
     train_dataset=tokenized_train_dataset,
     eval_dataset=tokenized_eval_dataset,
     tokenizer=tokenizer,
+    data_collator=DataCollatorWithPadding(tokenizer),  # Pad each batch to its longest window
 )
 
 # Train the model
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import random
+from unicodedata import normalize
+from records import iter_records
+from tables import index_tables, merge_tables
+
+# Question -> trial sections its context is built from
+MAPPING = {
+    "Why was the research needed?": ["Objectives"],
+    "How long was the trial?": ["Study Start/End Dates", "Reason for Termination"],
+    "Who was in this clinical trial?": ["Study Population: Key Inclusion/Exclusion Criteria"],
+    "What treatments did the participants take?": ["Statistical Methods", "Trial Analysis"],
+    "What happened during the trial?": ["Study Design/Methodology"],
+    "What were the results of the trial?": ["Trial Analysis", "Conclusion"],
+    "What adverse events did participants report?": ["Trial Analysis"],
+    "How has this trial helped?": ["Conclusion"],
+}
+
+def question_file_name(question):
+    return f'{question.replace(" ", "_").replace("?", "")}.json'
+
+def normalize_text(text):
+    # ASCII-fold and collapse whitespace, as the mapping cell of the notebook did
+    text = normalize('NFKD', text.strip()).encode('ascii', 'ignore').decode(encoding="utf-8")
+    return ' '.join(text.split())
+
+def build_section_index(records, mapping):
+    """Read the database once into columns: one list per needed section and question.
+
+    Every value is normalised a single time, however many questions use it.
+    """
+    sections = list(dict.fromkeys(section for question_sections in mapping.values() for section in question_sections))
+    index = {
+        'trial_name': [],
+        'trial': {section: [] for section in sections},
+        'summary': {question: [] for question in mapping}
+    }
+
+    for record in records:
+        index['trial_name'].append(record['trial_name'])
+        for section, column in index['trial'].items():
+            column.append(normalize_text(record['trial'].get(section, "")))
+        for question, column in index['summary'].items():
+            column.append(normalize_text(record['summary'].get(question, "")))
+
+    return index
+
+def question_entries(index, question, sections):
+    contexts = zip(*(index['trial'][section] for section in sections))
+    answers = index['summary'][question]
+    entries = []
+    for trial_name, parts, answer in zip(index['trial_name'], contexts, answers):
+        context = ' '.join(part for part in parts if part)
+        if answer and context:
+            entries.append({
+                "trial_name": trial_name,
+                "question": question,
+                "context": context,
+                "answer": answer
+            })
+    return entries
+
+def split_entries(entries, test_size, seed, name):
+    # The shuffle only depends on the seed and the file name, so reruns
+    # produce the same split
+    shuffled = list(entries)
+    random.Random(f"{seed}:{name}").shuffle(shuffled)
+    split_index = int((1 - test_size) * len(shuffled))
+    return shuffled[:split_index], shuffled[split_index:]
+
+def write_json(data, path):
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, indent=4)
+
+def build_datasets(database_file, output_dir, full_dir, test_size, seed, tables_file=None, mapping=MAPPING, raw=False):
+    records = iter_records(database_file)
+    if tables_file:
+        # Merge the tables while indexing, in the same pass over the database
+        records = merge_tables(records, index_tables(tables_file), not raw)
+    index = build_section_index(records, mapping)
+    print(f"Indexed {len(index['trial_name'])} trials from '{database_file}'")
+
+    os.makedirs(os.path.join(output_dir, full_dir), exist_ok=True)
+    for question, sections in mapping.items():
+        name = question_file_name(question)
+        entries = question_entries(index, question, sections)
+        train_data, test_data = split_entries(entries, test_size, seed, name)
+
+        write_json(entries, os.path.join(output_dir, full_dir, name))
+        write_json(train_data, os.path.join(output_dir, f'train_{name}'))
+        write_json(test_data, os.path.join(output_dir, f'test_{name}'))
+        print(f"{question} {len(train_data)} train / {len(test_data)} test examples")
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Build the question-specific train/test datasets from the trial database.")
+    argument_parser.add_argument("database_file", help="cleaned database, .json or JSON Lines")
+    argument_parser.add_argument("--output-dir", default="FinalDataset")
+    argument_parser.add_argument("--full-dir", default="FullDataset2",
+                                 help="sub-directory of the output directory for the unsplit question files")
+    argument_parser.add_argument("--tables", default=None,
+                                 help="tables.md to merge into the database as 'Trial Analysis'")
+    argument_parser.add_argument("--raw", action="store_true",
+                                 help="keep sponsor boilerplate in the merged tables instead of scrubbing it")
+    argument_parser.add_argument("--test-size", type=float, default=0.15)
+    argument_parser.add_argument("--seed", type=int, default=42)
+    args = argument_parser.parse_args()
+
+    build_datasets(args.database_file, args.output_dir, args.full_dir, args.test_size, args.seed, args.tables, raw=args.raw)
+
+    print("All files have been successfully processed.")
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+
+def file_hash(path, chunk_size=1 << 20):
+    # SHA-256 of the file contents, read in chunks
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Manifest:
+    """Persistent record of which inputs produced which outputs.
+
+    Each entry is keyed by input name and stores the input content hash,
+    the kind of parser used, the parser version and the output paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.entries = json.load(file)
+
+    def is_fresh(self, key, digest, kind, version, outputs):
+        # An input is up to date when nothing in its entry changed and all
+        # of its outputs are still on disk
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        return (entry.get('hash') == digest
+                and entry.get('kind') == kind
+                and entry.get('version') == version
+                and entry.get('outputs') == list(outputs)
+                and all(os.path.exists(output) for output in outputs))
+
+    def update(self, key, digest, kind, version, outputs):
+        self.entries[key] = {
+            'hash': digest,
+            'kind': kind,
+            'version': version,
+            'outputs': list(outputs)
+        }
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run never leaves
+        # a truncated manifest behind
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.entries, file, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
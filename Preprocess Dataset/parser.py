@@ -2,374 +2,271 @@
 import os
 import sys
 import re
+import time
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import XMLGenerator
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextBoxHorizontal, LTChar
+from manifest import Manifest, file_hash
+from schema import load_schema
+
+# Bump whenever a change to the parsers alters the XML they produce, so that
+# previously parsed PDFs are rebuilt on the next run
+PARSER_VERSION = "3"
+MANIFEST_NAME = ".parser_manifest.json"
+
+def group_table_rows(lines):
+    # Group (bbox, text) lines into rows of vertically aligned lines, top to
+    # bottom, with the cells of each row ordered left to right
+    rows = []
+    for (x0, y0, x1, y1), text in sorted(lines, key=lambda line: (-line[0][3], line[0][0])):
+        middle = (y0 + y1) / 2
+        if rows and abs(rows[-1][0] - middle) <= (y1 - y0) / 2:
+            rows[-1][1].append((x0, text))
+        else:
+            rows.append((middle, [(x0, text)]))
+    return [[text for _, text in sorted(cells)] for _, cells in rows]
+
+class TreeXMLWriter:
+    """Builds the document as an ElementTree and writes it when closed."""
+
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        self.root = ET.Element("document")
+        self.section_element = None
+        self.table_element = None
+
+    def start_section(self, name):
+        self.section_element = ET.SubElement(self.root, "section", name=name)
+        self.table_element = None
+
+    def add_line(self, text, bold, italic, underline):
+        line_element = ET.SubElement(self.section_element, "line")
+        if bold:
+            line_element.set('bold', 'yes')
+        if italic:
+            line_element.set('italic', 'yes')
+        if underline:
+            line_element.set('underline', 'yes')
+        line_element.text = text
+
+    def add_rows(self, rows):
+        for row in rows:
+            # Create the table element once per section
+            if self.table_element is None:
+                self.table_element = ET.SubElement(self.section_element, "table")
+            row_element = ET.SubElement(self.table_element, "row")
+            for text in row:
+                cell_element = ET.SubElement(row_element, "cell")
+                cell_element.text = text
 
-class ClinicalTrial:
-    def __init__(self, variable):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            tree = ET.ElementTree(self.root)
+            tree.write(self.xml_path, encoding='utf-8', xml_declaration=True)
+        return False
+
+class StreamingXMLWriter:
+    """Writes the same document schema incrementally with an XMLGenerator.
+
+    Output goes to a temporary file that replaces xml_path only once the
+    whole document has been written.
+    """
+
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        self.tmp_path = xml_path + ".part"
+        self.file = None
+        self.generator = None
+        self.in_section = False
+        self.in_table = False
+
+    def _end_section(self):
+        if self.in_table:
+            self.generator.endElement("table")
+            self.in_table = False
+        if self.in_section:
+            self.generator.endElement("section")
+            self.in_section = False
+
+    def start_section(self, name):
+        self._end_section()
+        self.generator.startElement("section", {"name": name})
+        self.in_section = True
+
+    def add_line(self, text, bold, italic, underline):
+        attributes = {}
+        if bold:
+            attributes['bold'] = 'yes'
+        if italic:
+            attributes['italic'] = 'yes'
+        if underline:
+            attributes['underline'] = 'yes'
+        self.generator.startElement("line", attributes)
+        self.generator.characters(text)
+        self.generator.endElement("line")
+
+    def add_rows(self, rows):
+        for row in rows:
+            # Open the table element once per section
+            if not self.in_table:
+                self.generator.startElement("table", {})
+                self.in_table = True
+            self.generator.startElement("row", {})
+            for text in row:
+                self.generator.startElement("cell", {})
+                self.generator.characters(text)
+                self.generator.endElement("cell")
+            self.generator.endElement("row")
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        self.generator = XMLGenerator(self.file, encoding='utf-8', short_empty_elements=True)
+        self.generator.startDocument()
+        self.generator.startElement("document", {})
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._end_section()
+            self.generator.endElement("document")
+            self.generator.endDocument()
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.xml_path)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+# fontname -> (bold, italic, underline); documents reuse a handful of fonts
+_font_properties_cache = {}
+
+def font_properties(fontname):
+    properties = _font_properties_cache.get(fontname)
+    if properties is None:
+        lowered = fontname.lower()
+        properties = (
+            'bold' in lowered,
+            'italic' in lowered or 'oblique' in lowered,
+            'underline' in lowered
+        )
+        _font_properties_cache[fontname] = properties
+    return properties
+
+class SectionParser:
+    """Converts a PDF into sectioned XML following a SectionSchema.
+
+    The schema (section headers, aliases and table sections) is loaded and
+    compiled once per process and shared by every parser built from it.
+    """
+
+    def __init__(self, variable, schema_name):
         self.variable = variable
-        # List of sections to recognize
-        self._SECTIONS = [
-            "Generic Drug Name",
-            "Protocol Number",
-            "Study Start/End Dates",
-            "Reason for Termination",
-            "Study Design/Methodology",
-            "Centers",
-            "Objectives",
-            "Test Product(s), Dose(s), and Mode(s) of Administration",
-            "Statistical Methods",
-            "Study Population: Key Inclusion/Exclusion Criteria",
-            "Participant Flow Table",
-            "Baseline Characteristics",
-            "Primary Outcome Result(s)",
-            "Secondary Outcome Result(s)",
-            "Summary of Safety",
-            "Safety Results",
-            "All-Cause Mortality",
-            "Serious Adverse Events",
-            "Other .* Adverse Events",
-            "Other Relevant Findings",
-            "Conclusion",
-            "Date of Clinical Trial Report"
-        ]
-
-        # Sections that contain table structures
-        self._TABLE_SECTIONS = [
-            "Participant Flow Table",
-            "Baseline Characteristics",
-            "Primary Outcome Result(s)",
-            "Secondary Outcome Result(s)",
-            "All-Cause Mortality",
-            "Serious Adverse Events",
-            "Other .* Adverse Events"
-        ]
-
-        # Compile regex patterns for each section
-        self._section_patterns = {section: re.compile(section, re.IGNORECASE) for section in self._SECTIONS}
+        self.schema = load_schema(schema_name)
         self._page_number_pattern = re.compile(r'Page \d+', re.IGNORECASE)
 
     def get_text_properties(self, text_line):
         bold = italic = underline = False
+        seen_fonts = set()
         for character in text_line:
             if isinstance(character, LTChar):
-                fontname = character.fontname.lower()
-                if 'bold' in fontname:
-                    bold = True
-                if 'italic' in fontname or 'oblique' in fontname:
-                    italic = True
-                if 'underline' in fontname:
-                    underline = True
+                fontname = character.fontname
+                # A line usually uses one or two fonts, only look at each once
+                if fontname in seen_fonts:
+                    continue
+                seen_fonts.add(fontname)
+                font_bold, font_italic, font_underline = font_properties(fontname)
+                bold = bold or font_bold
+                italic = italic or font_italic
+                underline = underline or font_underline
+                if bold and italic and underline:
+                    break
         return bold, italic, underline
 
     def detect_section(self, text, bold):
         if not bold:
             return None
-        for section, pattern in self._section_patterns.items():
-            if pattern.search(text):
-                return section
-        return None
-
-    def pdf_to_xml(self, pdf_path, xml_path):
-        # Create the root element
-        root = ET.Element("document")
-
-        # Combine all PDF content into a single logical page
-        all_text_elements = []
-
-        for page_layout in extract_pages(pdf_path):
-            for element in page_layout:
-                if isinstance(element, LTTextBoxHorizontal):
-                    for text_line in element:
-                        text = text_line.get_text().strip()
-                        # Skip lines containing page numbering
-                        if self._page_number_pattern.search(text):
-                            continue
-                        all_text_elements.append((text_line, text))
+        return self.schema.detect(text)
+
+    def _iter_page_lines(self, page_layout):
+        # Yield (text_line, text) for every kept line of a single page
+        for element in page_layout:
+            if isinstance(element, LTTextBoxHorizontal):
+                for text_line in element:
+                    text = text_line.get_text().strip()
+                    # Skip lines containing page numbering
+                    if self._page_number_pattern.search(text):
+                        continue
+                    # Skip lines containing "Clinical Trial Results Website"
+                    if "Clinical Trial Results Website" in text:
+                        continue
+                    yield text_line, text
+
+    def pdf_to_xml(self, pdf_path, xml_path, stream=True):
+        # Write sections and lines as they are produced, or build the whole
+        # tree in memory first when stream is False
+        writer = StreamingXMLWriter(xml_path) if stream else TreeXMLWriter(xml_path)
 
-        # Process the combined content
         current_section = None
-        section_element = None
         inside_table_section = False
+        pending_rows = []
+
+        with writer:
+            # Stream the document page by page; each page layout is released as
+            # soon as its lines have been written
+            for page_layout in extract_pages(pdf_path):
+                for text_line, text in self._iter_page_lines(page_layout):
+                    # Get the properties of the text line
+                    bold, italic, underline = self.get_text_properties(text_line)
+
+                    # Detect section
+                    new_section = self.detect_section(text, bold)
+                    if new_section:
+                        # Rows collected so far belong to the previous section's table
+                        writer.add_rows(group_table_rows(pending_rows))
+                        pending_rows.clear()
+                        current_section = new_section
+                        writer.start_section(current_section)
+                        inside_table_section = self.schema.table_flags[current_section]
+                        if inside_table_section:
+                            # The header is written as a row of its own, so it
+                            # stays the first text of the section however the
+                            # table lines below it are ordered
+                            writer.add_rows([[text]])
+                            continue
 
-        for text_line, text in all_text_elements:
-            # Skip lines containing "Clinical Trial Results Website"
-            if "Clinical Trial Results Website" in text:
-                continue
-
-            # Get the properties of the text line
-            bold, italic, underline = self.get_text_properties(text_line)
+                    if inside_table_section:
+                        if not text:  # skip empty lines
+                            continue
 
-            # Detect section
-            new_section = self.detect_section(text, bold)
-            if new_section:
-                current_section = new_section
-                section_element = ET.SubElement(root, "section", name=current_section)
-                inside_table_section = any(re.search(pattern, current_section, re.IGNORECASE) for pattern in self._TABLE_SECTIONS)
+                        # Rows are built from the line positions once the page is done
+                        pending_rows.append((text_line.bbox, text))
+                    else:
+                        # Lines before the first detected section
+                        if current_section is None:
+                            current_section = "Uncategorized"
+                            writer.start_section(current_section)
 
-            if inside_table_section:
-                if not text:  # skip empty lines
-                    continue
+                        writer.add_line(text, bold, italic, underline)
 
-                # Create or continue a table element
-                if not any(child.tag == 'table' for child in section_element):
-                    table_element = ET.SubElement(section_element, "table")
-                else:
-                    table_element = section_element.find("table")
+                # Table rows never span pages
+                writer.add_rows(group_table_rows(pending_rows))
+                pending_rows.clear()
 
-                # Create a row element within the table
-                row_element = ET.SubElement(table_element, "row")
-                cell_element = ET.SubElement(row_element, "cell")
-                cell_element.text = text
-            else:
-                # Create a line element within the current section
-                if section_element is None:
-                    section_element = ET.SubElement(root, "section", name="Uncategorized")
-
-                line_element = ET.SubElement(section_element, "line")
-                if bold:
-                    line_element.set('bold', 'yes')
-                if italic:
-                    line_element.set('italic', 'yes')
-                if underline:
-                    line_element.set('underline', 'yes')
-                line_element.text = text
-
-        # Create a tree structure
-        tree = ET.ElementTree(root)
-
-        # Write the tree to an XML file
-        tree.write(xml_path, encoding='utf-8', xml_declaration=True)
         print(f"PDF content successfully written to {xml_path}")
-        print(f"Class Clinical Trial, pdf_to_xml executed on {pdf_path} with variable {self.variable}")
+        print(f"Class {self.schema.label}, pdf_to_xml executed on {pdf_path} with variable {self.variable}")
 
-class PatientSummary:
+class ClinicalTrial(SectionParser):
     def __init__(self, variable):
-        self.variable = variable
-        # List of sections to recognize
-        self._SECTIONS = [
-            "Did any patients have serious adverse events?",
-            "How many participants had adverse events?",
-            "How many participants reported serious adverse events?",
-            "How many patients had adverse events during the trial?",
-            "What adverse events did participants report?",
-            "What adverse events did the participants have?",
-            "What serious adverse events did participants have?",
-            "What serious adverse events did the participants have?",
-            "What was the most common serious adverse event?",
-            "What were the most common serious adverse events?",
-            "What were the serious adverse events?",
-            "What non-serious adverse events did participants have?",
-            "What other adverse events did the participants have?",
-            "What was the most common non-serious adverse event?",
-            "What were the most common non-serious adverse events?",
-            "What were the non-serious adverse events?",
-            "What were the results of the trial?",
-            "What were the results of this study?",
-            "What were the key results of this trial?",
-            "What were the main results of the trial?",
-            "What were the main results of this clinical trial?",
-            "What were the main results of this trial?",
-            "What was the main result of this trial?",
-            "What was learned from this trial?",
-            "What medical problems did patients have?",
-            "What medical problems did the participants have during the entire trial, up to Week 60?",
-            "What medical problems did the participants have during the trial?",
-            "What medical problems happened during the trial?",
-            "How has this clinical trial helped patients and researchers?",
-            "How has this trial helped patients and researchers?",
-            "How has this trial helped?",
-            "How was this trial useful?",
-            "What happened during the trial?",
-            "What happened during this clinical trial?",
-            "What happened during this trial?",
-            "What treatments did the participants receive?",
-            "What treatments did the participants take?",
-            "What trial treatments did the participants take?",
-            "What other key results were learned?",
-            "What other results were learned?",
-            "What were the other results of this trial?",
-            "Who was in the trial?",
-            "Who was in this clinical trial?",
-            "Who was in this trial?",
-            "What kind of trial was this?",
-            "What type of clinical trial was this?",
-            "What was the purpose of this clinical trial?",
-            "What was the purpose of this trial?",
-            "What was the main purpose of this trial?",
-            "What was the goal of this observational study?",
-            "Why was the research needed?",
-            "How long was the trial?",
-            "How long was this trial?",
-            "How many participants stopped trial drug due to adverse events?",
-            "How this trial was designed",
-            "What has happened since the trial ended?",
-            "Where can I learn more about this trial?",
-            "Thank you"
-        ]
-
-        self._mappingSections = {
-            "Did any patients have serious adverse events?": "What adverse events did participants report?",
-            "How many participants had adverse events?": "What adverse events did participants report?",
-            "How many participants reported serious adverse events?": "What adverse events did participants report?",
-            "How many patients had adverse events during the trial?": "What adverse events did participants report?",
-            "What adverse events did participants report?": "What adverse events did participants report?",
-            "What adverse events did the participants have?": "What adverse events did participants report?",
-            "What serious adverse events did participants have?": "What adverse events did participants report?",
-            "What serious adverse events did the participants have?": "What adverse events did participants report?",
-            "What was the most common serious adverse event?": "What adverse events did participants report?",
-            "What were the most common serious adverse events?": "What adverse events did participants report?",
-            "What were the serious adverse events?": "What adverse events did participants report?",
-            "What non-serious adverse events did participants have?": "What non-serious adverse events did participants have?",
-            "What other adverse events did the participants have?": "What non-serious adverse events did participants have?",
-            "What was the most common non-serious adverse event?": "What non-serious adverse events did participants have?",
-            "What were the most common non-serious adverse events?": "What non-serious adverse events did participants have?",
-            "What were the non-serious adverse events?": "What non-serious adverse events did participants have?",
-            "What were the results of the trial?": "What were the results of the trial?",
-            "What were the results of this study?": "What were the results of the trial?",
-            "What were the key results of this trial?": "What were the results of the trial?",
-            "What were the main results of the trial?": "What were the results of the trial?",
-            "What were the main results of this clinical trial?": "What were the results of the trial?",
-            "What were the main results of this trial?": "What were the results of the trial?",
-            "What was the main result of this trial?": "What were the results of the trial?",
-            "What was learned from this trial?": "What were the results of the trial?",
-            "What medical problems did patients have?": "What medical problems did patients have?",
-            "What medical problems did the participants have during the entire trial, up to Week 60?": "What medical problems did patients have?",
-            "What medical problems did the participants have during the trial?": "What medical problems did patients have?",
-            "What medical problems happened during the trial?": "What medical problems did patients have?",
-            "How has this clinical trial helped patients and researchers?": "How has this trial helped?",
-            "How has this trial helped patients and researchers?": "How has this trial helped?",
-            "How has this trial helped?": "How has this trial helped?",
-            "How was this trial useful?": "How has this trial helped?",
-            "What happened during the trial?": "What happened during the trial?",
-            "What happened during this clinical trial?": "What happened during the trial?",
-            "What happened during this trial?": "What happened during the trial?",
-            "What treatments did the participants receive?": "What treatments did the participants take?",
-            "What treatments did the participants take?": "What treatments did the participants take?",
-            "What trial treatments did the participants take?": "What treatments did the participants take?",
-            "What other key results were learned?": "What other results were learned?",
-            "What other results were learned?": "What other results were learned?",
-            "What were the other results of this trial?": "What other results were learned?",
-            "Who was in the trial?": "Who was in this clinical trial?",
-            "Who was in this clinical trial?": "Who was in this clinical trial?",
-            "Who was in this trial?": "Who was in this clinical trial?",
-            "What kind of trial was this?": "What kind of trial was this?",
-            "What type of clinical trial was this?": "What kind of trial was this?",
-            "What was the purpose of this clinical trial?": "What was the purpose of this clinical trial?",
-            "What was the purpose of this trial?": "What was the purpose of this clinical trial?",
-            "What was the main purpose of this trial?": "What was the purpose of this clinical trial?",
-            "What was the goal of this observational study?": "What was the purpose of this clinical trial?",
-            "Why was the research needed?": "Why was the research needed?", 
-            "How long was the trial?": "How long was the trial?", 
-            "How long was this trial?": "How long was the trial?",
-            "How many participants stopped trial drug due to adverse events?": "How many participants stopped trial drug due to adverse events?", 
-            "How this trial was designed": "How this trial was designed", 
-            "What has happened since the trial ended?": "What has happened since the trial ended?",
-            "Where can I learn more about this trial?": "Where can I learn more about this trial?",
-            "Thank you": "Thank you"
-        }
-
-        # Sections that contain table structures
-        self._TABLE_SECTIONS = []
-
-        # Compile regex patterns for each section
-        self._section_patterns = {section: re.compile(section, re.IGNORECASE) for section in self._SECTIONS}
-        self._page_number_pattern = re.compile(r'Page \d+', re.IGNORECASE)
-
-    def get_text_properties(self, text_line):
-        bold = italic = underline = False
-        for character in text_line:
-            if isinstance(character, LTChar):
-                fontname = character.fontname.lower()
-                if 'bold' in fontname:
-                    bold = True
-                if 'italic' in fontname or 'oblique' in fontname:
-                    italic = True
-                if 'underline' in fontname:
-                    underline = True
-        return bold, italic, underline
-
-    def detect_section(self, text, bold):
-        if not bold:
-            return None
-        for section, pattern in self._section_patterns.items():
-            if pattern.search(text):
-                return self._mappingSections.get(section)
-        return None
-
-    def pdf_to_xml(self, pdf_path, xml_path):
-        # Create the root element
-        root = ET.Element("document")
-
-        # Combine all PDF content into a single logical page
-        all_text_elements = []
-
-        for page_layout in extract_pages(pdf_path):
-            for element in page_layout:
-                if isinstance(element, LTTextBoxHorizontal):
-                    for text_line in element:
-                        text = text_line.get_text().strip()
-                        # Skip lines containing page numbering
-                        if self._page_number_pattern.search(text):
-                            continue
-                        all_text_elements.append((text_line, text))
-
-        # Process the combined content
-        current_section = None
-        section_element = None
-        inside_table_section = False
-
-        for text_line, text in all_text_elements:
-            # Skip lines containing "Clinical Trial Results Website"
-            if "Clinical Trial Results Website" in text:
-                continue
+        super().__init__(variable, "ct")
 
-            # Get the properties of the text line
-            bold, italic, underline = self.get_text_properties(text_line)
-
-            # Detect section
-            new_section = self.detect_section(text, bold)
-            if new_section:
-                current_section = new_section
-                section_element = ET.SubElement(root, "section", name=current_section)
-                inside_table_section = any(re.search(pattern, current_section, re.IGNORECASE) for pattern in self._TABLE_SECTIONS)
-
-            if inside_table_section:
-                if not text:  # skip empty lines
-                    continue
-
-                # Create or continue a table element
-                if not any(child.tag == 'table' for child in section_element):
-                    table_element = ET.SubElement(section_element, "table")
-                else:
-                    table_element = section_element.find("table")
-
-                # Create a row element within the table
-                row_element = ET.SubElement(table_element, "row")
-                cell_element = ET.SubElement(row_element, "cell")
-                cell_element.text = text
-            else:
-                # Create a line element within the current section
-                if section_element is None:
-                    section_element = ET.SubElement(root, "section", name="Uncategorized")
-
-                line_element = ET.SubElement(section_element, "line")
-                if bold:
-                    line_element.set('bold', 'yes')
-                if italic:
-                    line_element.set('italic', 'yes')
-                if underline:
-                    line_element.set('underline', 'yes')
-                line_element.text = text
-
-        # Create a tree structure
-        tree = ET.ElementTree(root)
-
-        # Write the tree to an XML file
-        tree.write(xml_path, encoding='utf-8', xml_declaration=True)
-        print(f"PDF content successfully written to {xml_path}")
-        print(f"Class Patient Summary, pdf_to_xml executed on {pdf_path} with variable {self.variable}")
+class PatientSummary(SectionParser):
+    def __init__(self, variable):
+        super().__init__(variable, "summary")
 
 def replace_suffix(file_name):
     if file_name.endswith(".pdf"):
@@ -377,34 +274,106 @@ def replace_suffix(file_name):
     else:
         return file_name
 
-def process_files(directory, variable):
+def get_parser(variable):
+    # Determine the schema based on the variable: 'ct', a schema file, or
+    # the patient summary schema for anything else
+    if variable == 'ct':
+        return ClinicalTrial(variable)
+    if os.path.isfile(variable):
+        return SectionParser(variable, variable)
+    return PatientSummary(variable)
+
+# Parser instance owned by each worker process, built once by _init_worker
+_worker_instance = None
+
+def _init_worker(variable):
+    global _worker_instance
+    _worker_instance = get_parser(variable)
+
+def _parse_file(file_path):
+    # Parse a single PDF, returning (file_path, elapsed seconds, error or None)
+    xml_path = replace_suffix(file_path)
+    start = time.time()
+    try:
+        _worker_instance.pdf_to_xml(file_path, xml_path)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return file_path, time.time() - start, error
+
+def print_timings(results, elapsed_time):
+    failed = [(path, error) for path, _, error in results if error]
+    print('############################ <Script Logging>: Per-file timings')
+    for path, seconds, error in sorted(results, key=lambda r: r[1], reverse=True):
+        status = "FAILED" if error else "ok"
+        print(f"{seconds:10.2f}s  {status:6}  {os.path.basename(path)}")
+    print(f"Parsed {len(results) - len(failed)}/{len(results)} files in {elapsed_time:.2f} seconds")
+    for path, error in failed:
+        print(f"Failed to parse '{os.path.basename(path)}': {error}")
+
+def process_files(directory, variable, workers=1, force=False):
     if not os.path.isdir(directory):
         print(f"The provided path '{directory}' is not a directory.")
-        return
-
-    # List all files in the directory
-    files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-
-    # Determine the class and method based on the variable
-    if variable == 'ct':
-        chosen_instance = ClinicalTrial(variable)
-    else:
-        chosen_instance = PatientSummary(variable)
+        return []
+
+    # List all PDF files in the directory
+    files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)) and f.lower().endswith(".pdf")]
+    file_paths = [os.path.join(directory, f) for f in sorted(files)]
+
+    # Skip PDFs whose XML output is already up to date; editing the schema
+    # file changes the version and rebuilds everything parsed with it
+    schema = get_parser(variable).schema
+    kind = schema.kind
+    version = f"{PARSER_VERSION}:{schema.digest}"
+    manifest = Manifest(os.path.join(directory, MANIFEST_NAME))
+    digests = {file_path: file_hash(file_path) for file_path in file_paths}
+    stale_paths = [file_path for file_path in file_paths
+                   if force or not manifest.is_fresh(os.path.basename(file_path), digests[file_path], kind, version, [replace_suffix(file_path)])]
+    print(f"{len(file_paths) - len(stale_paths)} of {len(file_paths)} files are up to date, parsing {len(stale_paths)}")
+
+    _start = time.time()
+    results = []
+    try:
+        if workers <= 1:
+            _init_worker(variable)
+            for file_path in stale_paths:
+                print(f"Now Parsing:'{os.path.basename(file_path)}'")
+                results.append(_parse_file(file_path))
+        else:
+            # Each worker builds its own parser instance once; a failing PDF only
+            # affects its own result
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(variable,)) as executor:
+                futures = {executor.submit(_parse_file, file_path): file_path for file_path in stale_paths}
+                for future in as_completed(futures):
+                    try:
+                        file_path, seconds, error = future.result()
+                    except Exception as e:
+                        # The worker died (e.g. killed when out of memory); once the
+                        # pool is broken every pending file ends up here as failed
+                        file_path, seconds, error = futures[future], 0.0, f"{type(e).__name__}: {e}"
+                    print(f"Done Parsing:'{os.path.basename(file_path)}'")
+                    results.append((file_path, seconds, error))
+    finally:
+        # Record what was parsed, even if the run was interrupted
+        for file_path, _, error in results:
+            key = os.path.basename(file_path)
+            if error:
+                manifest.discard(key)
+            else:
+                manifest.update(key, digests[file_path], kind, version, [replace_suffix(file_path)])
+        manifest.save()
 
-    # Apply the chosen method to all files
-    for file in files:
-        file_path = os.path.join(directory, file)
-        xml_path = replace_suffix(file_path)
-        print(f"Now Parsing:'{file}'")
-        chosen_instance.pdf_to_xml(file_path, xml_path)
+    print_timings(results, time.time() - _start)
+    return results
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python parser.py <directory_path> <variable>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python parser.py <directory_path> <variable> [workers]")
         sys.exit(1)
 
     directory_path = sys.argv[1]
     variable = sys.argv[2]
-    
-    process_files(directory_path, variable)
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else 1
+
+    process_files(directory_path, variable, workers)
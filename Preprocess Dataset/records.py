@@ -0,0 +1,169 @@
+import glob
+import gzip
+import io
+import json
+import os
+
+# Record files are either a single indented JSON array (.json, the original
+# database.json format) or JSON Lines (.jsonl), optionally compressed with
+# gzip (.jsonl.gz) or zstandard (.jsonl.zst) and optionally split in shards
+# named <base>-00000.jsonl[.gz|.zst], <base>-00001.jsonl[.gz|.zst], ...
+
+def split_extension(path):
+    # 'db.jsonl.gz' -> ('db', '.jsonl.gz')
+    for extension in ('.jsonl.gz', '.jsonl.zst', '.jsonl', '.json'):
+        if path.endswith(extension):
+            return path[:-len(extension)], extension
+    raise ValueError(f"Unsupported record file '{path}', expected .json, .jsonl, .jsonl.gz or .jsonl.zst")
+
+def _open_text(path, mode):
+    # mode is 'r', 'w' or 'a'
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"The zstandard package is required to read or write '{path}'")
+        raw = open(path, mode + 'b')
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            # Appending adds a new frame, which readers concatenate
+            stream = zstandard.ZstdCompressor().stream_writer(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def shard_path(path, index):
+    base, extension = split_extension(path)
+    return f"{base}-{index:05d}{extension}"
+
+def record_paths(path):
+    # The file itself, or its shards in order when it was written sharded
+    if os.path.isdir(path):
+        return sorted(p for p in glob.glob(os.path.join(path, '*')) if p.endswith(('.json', '.jsonl', '.jsonl.gz', '.jsonl.zst')))
+    if os.path.exists(path):
+        return [path]
+    base, extension = split_extension(path)
+    return sorted(glob.glob(glob.escape(base) + '-[0-9][0-9][0-9][0-9][0-9]' + extension))
+
+def iter_records(path):
+    """Lazily yield the records stored at path (a file, a directory or a sharded base path)."""
+    for file_path in record_paths(path):
+        if file_path.endswith('.json'):
+            # A JSON array has to be loaded as a whole
+            with open(file_path, 'r', encoding='utf-8') as json_file:
+                yield from json.load(json_file)
+            continue
+        with _open_text(file_path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+def part_path(path):
+    # 'db.jsonl.gz' -> 'db.part.jsonl.gz', where a file is written before it replaces path
+    base, extension = split_extension(path)
+    return f"{base}.part{extension}"
+
+class RecordWriter:
+    """Writes records one at a time to a .json, .jsonl, .jsonl.gz or .jsonl.zst file.
+
+    With shard_size, a new shard is started every shard_size records. With
+    append, JSON Lines records are added after the existing ones instead of
+    replacing them.
+
+    Records go to .part files that only replace the output (and the shards
+    of an earlier run) once the writer is closed without an exception, so
+    a failed run leaves the previous output untouched and the output may
+    be the file the records are read from. Appending to a single file
+    writes to it directly.
+    """
+
+    def __init__(self, path, shard_size=None, append=False):
+        split_extension(path)
+        if path.endswith('.json') and (shard_size or append):
+            raise ValueError("Sharded or appended output needs a JSON Lines file (.jsonl, .jsonl.gz or .jsonl.zst)")
+        self.path = path
+        self.shard_size = shard_size
+        self.append = append
+        self.count = 0
+        self.file = None
+        self.first_shard = 0
+        self.existing_shards = []
+        # (part file, final path) of every file written so far
+        self.parts = []
+
+        if shard_size:
+            self.existing_shards = record_paths(path)
+            if append:
+                # New records go to new shards after the existing ones
+                self.first_shard = len(self.existing_shards)
+
+    def _open(self, target):
+        if self.append and not self.shard_size:
+            return _open_text(target, 'a')
+        self.parts.append((part_path(target), target))
+        return _open_text(part_path(target), 'w')
+
+    def _current_file(self):
+        if self.shard_size:
+            index, offset = divmod(self.count, self.shard_size)
+            if offset == 0 and self.file is not None:
+                self.file.close()
+                self.file = None
+            if self.file is None:
+                self.file = self._open(shard_path(self.path, self.first_shard + index))
+        elif self.file is None:
+            self.file = self._open(self.path)
+            if self.path.endswith('.json'):
+                self.file.write('[')
+        return self.file
+
+    def write(self, record):
+        file = self._current_file()
+        if self.path.endswith('.json'):
+            # Same layout as json.dump(records, indent=4)
+            separator = ',\n    ' if self.count else '\n    '
+            file.write(separator + json.dumps(record, indent=4).replace('\n', '\n    '))
+        else:
+            file.write(json.dumps(record) + '\n')
+        self.count += 1
+
+    def close(self):
+        if self.path.endswith('.json'):
+            file = self._current_file()
+            file.write('\n]' if self.count else ']')
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        targets = {target for _, target in self.parts}
+        if self.shard_size and not self.append:
+            # Remove the shards of an earlier run so none are read twice
+            for old_path in self.existing_shards:
+                if old_path not in targets:
+                    os.remove(old_path)
+            self.existing_shards = []
+        for part, target in self.parts:
+            os.replace(part, target)
+        self.parts = []
+
+    def discard(self):
+        # Drop everything written so far, keeping the previous output
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for part, _ in self.parts:
+            if os.path.exists(part):
+                os.remove(part)
+        self.parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
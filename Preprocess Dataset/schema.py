@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+def compile_section_matcher(sections):
+    # One alternation over every section pattern, group s<i> is sections[i].
+    # The leftmost match in the line wins, ties go to the earlier section
+    alternation = "|".join(f"(?P<s{i}>{section})" for i, section in enumerate(sections))
+    return re.compile(alternation, re.IGNORECASE)
+
+def table_flags(sections, table_patterns):
+    # Decide once per section name whether it is a table section
+    return {section: any(re.search(pattern, section, re.IGNORECASE) for pattern in table_patterns)
+            for section in sections if section is not None}
+
+class SectionSchema:
+    """Section layout of one document type, loaded from a schema file.
+
+    A schema file holds:
+        kind: short name of the document type, e.g. "ct" or "summary"
+        label: human readable name used in log messages
+        sections: regex patterns of the section headers, in priority order
+        aliases: header pattern -> canonical section name, for headers
+            that are not their own canonical name
+        table_sections: regex patterns of the canonical sections that
+            hold tables
+    """
+
+    def __init__(self, definition, digest):
+        self.kind = definition['kind']
+        self.label = definition['label']
+        self.sections = definition['sections']
+        self.aliases = definition.get('aliases', {})
+        self.table_sections = definition.get('table_sections', [])
+        self.digest = digest
+
+        # Compile all section patterns into one matcher, mapping each group to
+        # its canonical section name and whether it holds a table
+        self.matcher = compile_section_matcher(self.sections)
+        self.section_by_group = {f"s{i}": self.aliases.get(section, section) for i, section in enumerate(self.sections)}
+        self.table_flags = table_flags(self.section_by_group.values(), self.table_sections)
+        self.canonical_sections = list(dict.fromkeys(self.section_by_group.values()))
+
+    def detect(self, text):
+        match = self.matcher.search(text)
+        if match is None:
+            return None
+        return self.section_by_group[match.lastgroup]
+
+def schema_path(name):
+    # Accept either the name of a bundled schema or a path to a schema file
+    if os.path.isfile(name):
+        return name
+    return os.path.join(SCHEMA_DIR, f"{name}.json")
+
+@lru_cache(maxsize=None)
+def load_schema(name):
+    path = schema_path(name)
+    with open(path, 'rb') as file:
+        content = file.read()
+
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError(f"PyYAML is required to load the schema '{path}'")
+        definition = yaml.safe_load(content)
+    else:
+        definition = json.loads(content)
+
+    return SectionSchema(definition, hashlib.sha256(content).hexdigest())
@@ -0,0 +1,40 @@
+import re
+from functools import lru_cache
+
+# Sponsor boilerplate left in the extracted text: contact details, links and
+# the page footers of the patient summaries. Each entry covers every page
+# number and spacing variant of what used to be a long list of literal terms
+BOILERPLATE_PATTERNS = [
+    r"(?:https?://)?www\.clinicaltrialsregister\.eu(?:/ctr-search/search)?",
+    r"(?:https?://)?www\.novartis\.com/clinicaltrials",
+    r"(?:https?://)?www\.novartisclinicaltrials\.com",
+    r"(?:https?://)?www\.novctrd\.com",
+    r"(?:https?://)?www\.clinicaltrials\.gov",
+    r"1-888-669-6682\s*\(US\);?",
+    r"\+41-61-324[- ]1111\s*\(EU\);?",
+    r"Clinical Trial Results Website",
+    r"\|\s*Adults and Adolescent version\s*\|\s*Trial Results Summary\s*\|\s*\d+",
+    r"\|\s*Trial Results Summary\s*\|\s*(?:Parent|Adult) Version\s*\|\s*\d+",
+    r"\|\s*Trial Results Summary\s*\|\s*\d+",
+]
+
+@lru_cache(maxsize=1024)
+def scrub_pattern(trial_name=None):
+    # One alternation over all boilerplate, plus the trial name when given
+    patterns = list(BOILERPLATE_PATTERNS)
+    if trial_name:
+        patterns.append(re.escape(trial_name))
+    return re.compile("|".join(patterns))
+
+def scrub(text, trial_name=None):
+    """Replace all boilerplate (and the trial name) with a space in one pass and collapse whitespace."""
+    return ' '.join(scrub_pattern(trial_name).sub(' ', text).split())
+
+def scrub_record(record):
+    # Scrub every text section of a database entry in place
+    trial_name = record['trial_name']
+    for part in ('trial', 'summary'):
+        for key, value in record[part].items():
+            if isinstance(value, str):
+                record[part][key] = scrub(value, trial_name)
+    return record
@@ -0,0 +1,151 @@
+import argparse
+import math
+import re
+from records import RecordWriter, iter_records
+
+# Sections that are copied as they are, like the cleaning cell of finalDataset.ipynb
+TRIAL_SKIP_SECTIONS = {"Trial Analysis", "Generic Drug Name", "Protocol Number", "Date of Clinical Trial Report"}
+SUMMARY_SKIP_SECTIONS = {"Thank you"}
+
+_RUN_PATTERN = re.compile(r'[A-Za-z]+|[^A-Za-z]+')
+# "PDR001.Because" -> "PDR001. Because"
+_SENTENCE_GLUE_PATTERN = re.compile(r'(?<=[a-z0-9]{2}[.;:!?])(?=[A-Z][a-z])')
+# One-letter words a split may produce
+SINGLE_LETTER_WORDS = {"a", "i"}
+# Drug names and acronyms of the trial contexts that must come through unchanged
+PROTECTED_TERMS = [
+    "nilotinib", "canakinumab", "siponimod", "inclisiran", "imatinib", "iptacopan", "ianalumab",
+    "capmatinib", "trametinib", "ofatumumab", "secukinumab", "ribociclib", "asciminib", "placebo",
+    "HIV", "MRI", "COPD", "AEs", "SAEs", "HbA1c", "ECOG", "LDL-C", "PDR001"
+]
+
+def load_frequencies(path=None):
+    """Word -> count table, read from a 'word count' per line file or taken from pyspellchecker."""
+    if path:
+        frequencies = {}
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 2:
+                    frequencies[parts[0].lower()] = frequencies.get(parts[0].lower(), 0) + int(parts[1])
+        return frequencies
+
+    try:
+        from spellchecker import SpellChecker
+    except ImportError:
+        raise ImportError("pyspellchecker is required when no word frequency file is given")
+    return dict(SpellChecker().word_frequency.dictionary)
+
+class WordSegmenter:
+    """Splits words glued together by the PDF extraction ("inparticipants").
+
+    Each alphabetic run is segmented with a Viterbi pass over a unigram
+    model: a word costs -log p(word) plus split_penalty, and unknown strings
+    pay a cost that grows with their length, so runs are only split when
+    every piece is likelier than the run itself. The penalty keeps rare
+    names like "nilotinib" whole instead of cutting them into many short
+    dictionary words ("ni lot i nib"), and pieces of one letter other than
+    "a" and "i" are never produced. Runs with an uppercase letter after
+    their first one are acronyms ("COPD", "AEs") and are left alone.
+    Words are looked at up to max_word_length characters, which keeps the
+    pass linear in the text.
+    """
+
+    def __init__(self, frequencies, max_word_length=24, split_penalty=math.log(1000)):
+        total = sum(frequencies.values())
+        self.costs = {word.lower(): math.log(total / count) for word, count in frequencies.items() if count > 0}
+        self.max_word_length = min(max_word_length, max(len(word) for word in self.costs))
+        self.split_penalty = split_penalty
+        self._log_total = math.log(total)
+        self._cache = {}
+
+    def _unknown_cost(self, length):
+        return self._log_total + length * math.log(10)
+
+    def split_run(self, run):
+        # Segment one alphabetic run, keeping the original casing
+        lowered = run.lower()
+        if lowered in self.costs or not run[1:].islower():
+            return [run]
+        cached = self._cache.get(lowered)
+        if cached is None:
+            cached = self._viterbi(lowered)
+            self._cache[lowered] = cached
+        return [run[start:end] for start, end in cached]
+
+    def _viterbi(self, text):
+        # best[i] = (cost, start of the last word) of the best split of text[:i]
+        best = [(0.0, 0)] + [(math.inf, 0)] * len(text)
+        for end in range(1, len(text) + 1):
+            for start in range(max(0, end - self.max_word_length), end):
+                word = text[start:end]
+                cost = self.costs.get(word)
+                if cost is None or (len(word) == 1 and word not in SINGLE_LETTER_WORDS):
+                    continue
+                total = best[start][0] + cost + self.split_penalty
+                if total < best[end][0]:
+                    best[end] = (total, start)
+
+        # Keep the run whole when no split of known words beats it
+        if best[-1][0] >= self._unknown_cost(len(text)):
+            return [(0, len(text))]
+
+        spans = []
+        end = len(text)
+        while end > 0:
+            start = best[end][1]
+            spans.append((start, end))
+            end = start
+        return spans[::-1]
+
+    def segment_token(self, token):
+        pieces = []
+        for run in _RUN_PATTERN.findall(token):
+            if run[0].isalpha():
+                pieces.append(' '.join(self.split_run(run)))
+            else:
+                pieces.append(run)
+        return _SENTENCE_GLUE_PATTERN.sub(' ', ''.join(pieces))
+
+    def segment_text(self, text):
+        return ' '.join(self.segment_token(token) for token in text.split())
+
+def altered_terms(segmenter, terms=PROTECTED_TERMS):
+    # Protected terms the segmenter would change, as {term: segmented term}
+    return {term: segmenter.segment_text(term) for term in terms if segmenter.segment_text(term) != term}
+
+def segment_record(record, segmenter):
+    for key, value in record['trial'].items():
+        if isinstance(value, str) and key not in TRIAL_SKIP_SECTIONS:
+            record['trial'][key] = segmenter.segment_text(value)
+    for key, value in record['summary'].items():
+        if isinstance(value, str) and key not in SUMMARY_SKIP_SECTIONS:
+            record['summary'][key] = segmenter.segment_text(value)
+    return record
+
+def segment_database(input_file, output_file, segmenter):
+    # Stream the records through the segmenter, one trial at a time. The
+    # writer fills a .part file, so the output can be the input itself
+    with RecordWriter(output_file) as writer:
+        for record in iter_records(input_file):
+            print(f"Segmenting trial: '{record['trial_name']}'")
+            writer.write(segment_record(record, segmenter))
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Split words glued together by the PDF extraction in every trial of a database.")
+    argument_parser.add_argument("input_file", help="database.json or a JSON Lines database")
+    argument_parser.add_argument("output_file",
+                                 help="may be the input file, which is only replaced once every record is segmented")
+    argument_parser.add_argument("--frequencies", default=None,
+                                 help="'word count' per line file, defaults to the pyspellchecker English dictionary")
+    argument_parser.add_argument("--max-word-length", type=int, default=24)
+    args = argument_parser.parse_args()
+
+    segmenter = WordSegmenter(load_frequencies(args.frequencies), args.max_word_length)
+    altered = altered_terms(segmenter)
+    if altered:
+        argument_parser.error(f"the segmenter would alter protected terms: {altered}")
+    segment_database(args.input_file, args.output_file, segmenter)
+
+    print(f"Segmented database has been written to '{args.output_file}'")
@@ -0,0 +1,108 @@
+import argparse
+import os
+from records import RecordWriter, iter_records
+from scrubber import scrub as scrub_text
+
+# Trial sections whose text is replaced by the tables extracted to tables.md
+TABLE_SECTIONS = [
+    "Participant Flow Table",
+    "Baseline Characteristics",
+    "Primary Outcome Result(s)",
+    "Secondary Outcome Result(s)",
+    "All-Cause Mortality",
+    "Serious Adverse Events",
+    "Other .* Adverse Events",
+    "Safety Results"
+]
+TRIAL_ANALYSIS = "Trial Analysis"
+END_MARKER = '--- END ---'
+
+def iter_table_blocks(path):
+    """Yield (trial_name, lines) for every '## <trial_name>' block of tables.md.
+
+    A block starts at its header line and runs up to and including the
+    '--- END ---' marker, or up to the next header. The file is read line
+    by line.
+    """
+    current_header = None
+    current_content = []
+
+    with open(path, 'r') as file:
+        for line in file:
+            if line.startswith('## '):
+                if current_header and current_content:
+                    yield current_header, current_content
+                current_header = line[3:].strip()
+                current_content = [line]
+            elif line.strip() == END_MARKER:
+                current_content.append(line)
+                if current_header:
+                    yield current_header, current_content
+                current_header = None
+                current_content = []
+            else:
+                current_content.append(line)
+
+    # Handle the last block if it wasn't closed by '--- END ---'
+    if current_header and current_content:
+        yield current_header, current_content
+
+def split_sections(lines):
+    # '### <section>' headings of a block -> the markdown below each of them
+    sections = {}
+    section = None
+    for line in lines:
+        if line.startswith('### '):
+            section = line[4:].strip()
+            sections[section] = []
+        elif line.startswith('## ') or line.strip() == END_MARKER:
+            section = None
+        elif section is not None:
+            sections[section].append(line)
+    return {name: ''.join(content).strip() for name, content in sections.items()}
+
+def index_tables(path):
+    """Read tables.md once into {trial_name: {section: table_markdown}}.
+
+    Each trial also gets the whole block without its first two lines and
+    the end marker under 'Trial Analysis', as the per-trial files used to
+    provide it.
+    """
+    index = {}
+    for trial_name, lines in iter_table_blocks(path):
+        sections = split_sections(lines)
+        sections[TRIAL_ANALYSIS] = ''.join(lines[2:-1]) if len(lines) > 3 else ''
+        index[trial_name] = sections
+    return index
+
+def merge_tables(records, index, scrub=True):
+    # Replace the table sections of every trial found in the index with its
+    # Trial Analysis markdown, scrubbed like the rest of the trial at ingest
+    # time unless scrub is False
+    for record in records:
+        tables = index.get(record['trial_name'])
+        if tables is not None:
+            for section in TABLE_SECTIONS:
+                record['trial'].pop(section, None)
+            analysis = tables[TRIAL_ANALYSIS]
+            record['trial'][TRIAL_ANALYSIS] = scrub_text(analysis, record['trial_name']) if scrub else analysis
+        yield record
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Merge the tables of tables.md into the trial database.")
+    argument_parser.add_argument("tables_file")
+    argument_parser.add_argument("database_file")
+    argument_parser.add_argument("output_file")
+    argument_parser.add_argument("--raw", action="store_true",
+                                 help="keep sponsor boilerplate in the tables instead of scrubbing it, as xml2json.py --raw does")
+    args = argument_parser.parse_args()
+    if os.path.abspath(args.output_file) == os.path.abspath(args.database_file):
+        argument_parser.error("the output file must differ from the database file, which is read while writing")
+
+    index = index_tables(args.tables_file)
+    with RecordWriter(args.output_file) as writer:
+        for record in merge_tables(iter_records(args.database_file), index, not args.raw):
+            writer.write(record)
+
+    print(f"Tables of {len(index)} trials have been merged into '{args.output_file}'")
@@ -1,119 +1,229 @@
 import xml.etree.ElementTree as ET
-import json
 import re
 import os
-import sys
+import argparse
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from manifest import Manifest, file_hash
+from schema import load_schema
+from scrubber import scrub_record
+from records import RecordWriter, iter_records, record_paths, split_extension
+
+# Bump whenever a change here alters the entries written to the database
+XML2JSON_VERSION = "1"
+
+# Page footer of the patient summaries, e.g. "... or ... Summary | 3"
+_FOOTER_PATTERN = re.compile(r'[^\n]*? or [^\n]*? Summary \| \d')
+
+def is_footer(line):
+    # Cheap substring test first, the regex only runs on candidate lines
+    return 'Summary |' in line and _FOOTER_PATTERN.match(line) is not None
 
 def parse_xml_sections(xml_file, section_titles):
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+    section_titles = set(section_titles)
     sections = {}
-    
-    for section in root.findall('section'):
-        name = section.get('name')
+
+    # Walk the document incrementally, keeping at most one section in memory
+    context = ET.iterparse(xml_file, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event != 'end' or element.tag != 'section':
+            continue
+
+        name = element.get('name')
         if name in section_titles:
-            lines = list(section.itertext())
-            # Exclude the first line and remove lines matching the pattern
-            filtered_lines = [line for line in lines[1:] if not re.match(r'.* or .* Summary \| \d+', line)]
+            lines = list(element.itertext())
+            # Exclude the first line and remove page footer lines
+            filtered_lines = [line for line in lines[1:] if not is_footer(line)]
             text_content = "".join(filtered_lines)
             sections[name] = text_content.strip()
-    
+
+        # Drop the finished section
+        root.clear()
+
     return sections
 
-def create_json(data, output_file):
-    with open(output_file, 'w') as json_file:
-        json.dump(data, json_file, indent=4)
+def load_previous_entries(output_file):
+    # Entries of an earlier run, keyed by trial name, reused for unchanged pairs
+    if not record_paths(output_file):
+        return {}
+    return {entry['trial_name']: entry for entry in iter_records(output_file)}
+
+def match_files(trial_files, summary_files):
+    """Match every trial file to the summary files whose name starts with its ID.
+
+    Returns (pairs, unmatched_trials, unmatched_summaries, ambiguous) where
+    pairs holds (trial_id, trial_filename, summary_filename) tuples and
+    ambiguous maps each trial ID with several candidate summaries to all of
+    them. A summary is only a candidate for the longest trial ID it starts
+    with; when there are still several candidates the shortest name is used.
+    """
+    sorted_summaries = sorted(summary_files)
+    trial_ids = {os.path.splitext(f)[0] for f in trial_files}
+    pairs = []
+    unmatched_trials = []
+    ambiguous = {}
+    used_summaries = set()
+
+    for trial_filename in sorted(trial_files):
+        trial_id, trial_ext = os.path.splitext(trial_filename)
+
+        # Names sharing the prefix form one contiguous run in sorted order
+        index = bisect_left(sorted_summaries, trial_id)
+        candidates = []
+        while index < len(sorted_summaries) and sorted_summaries[index].startswith(trial_id):
+            candidates.append(sorted_summaries[index])
+            index += 1
+
+        # A summary that also starts with a longer trial ID belongs to that trial
+        candidates = [name for name in candidates
+                      if not any(name[:end] in trial_ids for end in range(len(trial_id) + 1, len(name) + 1))]
+
+        if not candidates:
+            unmatched_trials.append(trial_filename)
+            continue
+        if len(candidates) > 1:
+            ambiguous[trial_id] = candidates
+
+        summary_filename = min(candidates, key=lambda name: (len(name), name))
+        used_summaries.add(summary_filename)
+        pairs.append((trial_id, trial_filename, summary_filename))
+
+    unmatched_summaries = [f for f in sorted_summaries if f not in used_summaries]
+    return pairs, unmatched_trials, unmatched_summaries, ambiguous
+
+def print_match_report(unmatched_trials, unmatched_summaries, ambiguous):
+    for trial_filename in unmatched_trials:
+        print(f"No summary found for trial '{trial_filename}'")
+    for summary_filename in unmatched_summaries:
+        print(f"No trial found for summary '{summary_filename}'")
+    for trial_id, candidates in ambiguous.items():
+        print(f"Several summaries match trial '{trial_id}': {candidates}")
+
+def build_entry(trial_id, trial_file_path, summary_file_path, scrub=True):
+    # Parse one trial/summary pair into a database entry, removing sponsor
+    # boilerplate unless scrub is False
+    trial_sections = parse_xml_sections(trial_file_path, load_schema("ct").canonical_sections)
+    summary_sections = parse_xml_sections(summary_file_path, load_schema("summary").canonical_sections)
+
+    print(f"Currently parsing trial/summary: '{trial_id}'")
+
+    entry = {
+        "trial_name": trial_id,
+        "trial_file_path": trial_file_path,
+        "summary_file_path": summary_file_path,
+        "trial": trial_sections,
+        "summary": summary_sections
+    }
+    return scrub_record(entry) if scrub else entry
+
+def _build_entry(job):
+    # (entry, None), or (None, error) when the pair could not be parsed, so
+    # one broken XML file only fails its own pair
+    try:
+        return build_entry(*job), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python xml2json.py <trials_dir> <summaries_dir>")
-        sys.exit(1)
-
-    trials_dir = sys.argv[1]
-    summaries_dir = sys.argv[2]
-    
-    trial_section_titles = [
-        "Generic Drug Name",
-        "Protocol Number",
-        "Study Start/End Dates",
-        "Reason for Termination",
-        "Study Design/Methodology",
-        "Centers",
-        "Objectives",
-        "Test Product(s), Dose(s), and Mode(s) of Administration",
-        "Statistical Methods",
-        "Study Population: Key Inclusion/Exclusion Criteria",
-        "Participant Flow Table",
-        "Baseline Characteristics",
-        "Primary Outcome Result(s)",
-        "Secondary Outcome Result(s)",
-        "Summary of Safety",
-        "Safety Results",
-        "All-Cause Mortality",
-        "Serious Adverse Events",
-        "Other .* Adverse Events",
-        "Other Relevant Findings",
-        "Conclusion",
-        "Date of Clinical Trial Report"
-    ]
-
-    summary_section_titles = [
-        "What adverse events did participants report?",
-        "What non-serious adverse events did participants have?",
-        "What were the results of the trial?",
-        "What medical problems did patients have?",
-        "How has this trial helped?",
-        "What happened during the trial?",
-        "What treatments did the participants take?",
-        "What other results were learned?",
-        "Who was in this clinical trial?",
-        "What kind of trial was this?",
-        "What was the purpose of this clinical trial?",
-        "Why was the research needed?", 
-        "How long was the trial?", 
-        "How many participants stopped trial drug due to adverse events?", 
-        "How this trial was designed", 
-        "What has happened since the trial ended?",
-        "Where can I learn more about this trial?",
-        "Thank you"
-        ]
-
-    data = []
+    argument_parser = argparse.ArgumentParser(description="Combine the parsed trial and summary XML files into one database.")
+    argument_parser.add_argument("trials_dir")
+    argument_parser.add_argument("summaries_dir")
+    argument_parser.add_argument("--output", default="database.json",
+                                 help="database.json (indented array) or a JSON Lines file: .jsonl, .jsonl.gz or .jsonl.zst")
+    argument_parser.add_argument("--shard-size", type=int, default=None,
+                                 help="start a new JSON Lines shard every N trials")
+    argument_parser.add_argument("--raw", action="store_true",
+                                 help="keep sponsor boilerplate instead of scrubbing it at ingest time")
+    argument_parser.add_argument("--workers", type=int, default=1,
+                                 help="number of processes parsing pairs concurrently")
+    args = argument_parser.parse_args()
+
+    trials_dir = args.trials_dir
+    summaries_dir = args.summaries_dir
+
+    output_json_file = args.output
+    manifest = Manifest(split_extension(output_json_file)[0] + ".manifest.json")
+    previous_entries = load_previous_entries(output_json_file)
+    version = f"{XML2JSON_VERSION}:{'raw' if args.raw else 'scrubbed'}"
+    written = 0
+    reused = 0
+    failed = []
+    pool_error = None
 
     # Collect all trial and summary files
     trial_files = [f for f in os.listdir(trials_dir) if os.path.isfile(os.path.join(trials_dir, f))]
     summary_files = [f for f in os.listdir(summaries_dir) if os.path.isfile(os.path.join(summaries_dir, f))]
 
     # Match trial and summary files based on their common ID
-    for trial_filename in trial_files:
-        trial_id, trial_ext = os.path.splitext(trial_filename)
+    pairs, unmatched_trials, unmatched_summaries, ambiguous = match_files(trial_files, summary_files)
+    print_match_report(unmatched_trials, unmatched_summaries, ambiguous)
+
+    # Decide up front which pairs can reuse their previous entry
+    pairs.sort(key=lambda pair: pair[0])
+    jobs = []
+    digests = {}
+    for trial_id, trial_filename, summary_filename in pairs:
         trial_file_path = os.path.join(trials_dir, trial_filename)
-        
-        matched_summary_file = None
-        for summary_filename in summary_files:
-            if summary_filename.startswith(trial_id):
-                matched_summary_file = summary_filename
-                break
-        
-        if matched_summary_file:
-            summary_file_path = os.path.join(summaries_dir, matched_summary_file)
-            
-            trial_sections = parse_xml_sections(trial_file_path, trial_section_titles)
-            summary_sections = parse_xml_sections(summary_file_path, summary_section_titles)
-
-            print(f"Currently parsing trial/summary: '{trial_id}'")
-            
-            entry = {
-                "trial_name": trial_id,
-                "trial_file_path": trial_file_path,
-                "summary_file_path": summary_file_path,
-                "trial": trial_sections,
-                "summary": summary_sections
-            }
-            
-            data.append(entry)
-
-    output_json_file = "database.json"
-    create_json(data, output_json_file)
+        summary_file_path = os.path.join(summaries_dir, summary_filename)
+
+        # Reuse the previous entry when neither XML file changed. The entry
+        # comes from the previous output itself, so only inputs are checked
+        digest = ":".join([trial_file_path, file_hash(trial_file_path), summary_file_path, file_hash(summary_file_path)])
+        if trial_id in previous_entries and manifest.is_fresh(trial_id, digest, 'xml2json', version, []):
+            continue
+        digests[trial_id] = digest
+        jobs.append((trial_id, trial_file_path, summary_file_path, not args.raw))
+
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        # Results come back in job order, so the output is always sorted by
+        # trial name no matter how many workers ran
+        if executor:
+            new_entries = executor.map(_build_entry, jobs, chunksize=8)
+        else:
+            new_entries = map(_build_entry, jobs)
+
+        # Entries are written out in trial name order as soon as they are ready
+        with RecordWriter(output_json_file, shard_size=args.shard_size) as writer:
+            for trial_id, trial_filename, summary_filename in pairs:
+                if trial_id not in digests:
+                    writer.write(previous_entries.pop(trial_id))
+                    written += 1
+                    reused += 1
+                    continue
+
+                if pool_error:
+                    entry, error = None, pool_error
+                else:
+                    try:
+                        entry, error = next(new_entries)
+                    except Exception as e:
+                        # A worker died and took the pool down with it, every
+                        # remaining pair fails
+                        pool_error = f"{type(e).__name__}: {e}"
+                        entry, error = None, pool_error
+
+                if error:
+                    # Keep the last good entry, if any, and parse the pair again next run
+                    failed.append((trial_id, error))
+                    manifest.discard(trial_id)
+                    if trial_id in previous_entries:
+                        writer.write(previous_entries.pop(trial_id))
+                        written += 1
+                    continue
+
+                writer.write(entry)
+                written += 1
+                manifest.update(trial_id, digests[trial_id], 'xml2json', version, [])
+    finally:
+        if executor:
+            executor.shutdown()
+
+    manifest.save()
+
+    print(f"Reused {reused} unchanged trial/summary pairs, parsed {len(digests) - len(failed)}, failed {len(failed)}.")
+    for trial_id, error in failed:
+        print(f"Failed to parse trial/summary '{trial_id}': {error}")
 
     print(f"JSON file '{output_json_file}' has been created with the specified sections from all trials and summaries.")